@@ -0,0 +1,338 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after `ttl` seconds.
+
+    When `persist_path` is set, entries are saved as JSON so they survive restarts.
+    Writes are batched: a change schedules one save `save_delay` seconds later,
+    and pending changes are saved when the process exits."""
+
+    def __init__(self, maxsize=1024, ttl=3600, persist_path=None, save_delay=5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.save_delay = save_delay
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()  # One writer of the persist file at a time
+        self._save_timer = None
+        self._dirty = False
+        if persist_path:
+            self.load()
+            atexit.register(self.flush)
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key, evicting the least recently used entries if full."""
+        with self._lock:
+            self._data[key] = (value, time.time() + (ttl or self.ttl))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        self._changed()
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        self._changed()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        self._changed()
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def _changed(self):
+        """Mark the cache dirty and schedule a save if none is pending."""
+        if not self.persist_path:
+            return
+        with self._lock:
+            self._dirty = True
+            if self._save_timer is not None:
+                return
+            self._save_timer = threading.Timer(self.save_delay, self._scheduled_save)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _scheduled_save(self):
+        with self._lock:
+            self._save_timer = None
+        self.save()
+
+    def flush(self):
+        """Save now if there are unsaved changes."""
+        if self._dirty:
+            self.save()
+
+    def save(self):
+        """Write unexpired entries to the persist file atomically."""
+        tmp_path = None
+        try:
+            with self._save_lock:
+                now = time.time()
+                with self._lock:
+                    entries = [[key, value, expires_at] for key, (value, expires_at) in self._data.items()
+                               if expires_at >= now]
+                    self._dirty = False
+                directory = os.path.dirname(os.path.abspath(self.persist_path))
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(self.persist_path)}.",
+                                                suffix='.tmp')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.persist_path)
+                tmp_path = None
+        except Exception as e:
+            print(f"Error saving cache to {self.persist_path}: {str(e)}")
+        finally:
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def load(self):
+        """Load unexpired entries from the persist file."""
+        try:
+            with open(self.persist_path, 'r') as f:
+                entries = json.load(f)
+            now = time.time()
+            with self._lock:
+                for key, value, expires_at in entries:
+                    if expires_at >= now:
+                        self._data[key] = (value, expires_at)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading cache from {self.persist_path}: {str(e)}")
+
+
+def _trim_replies(node, depth):
+    """Copy a thread node keeping only `depth` levels of replies."""
+    trimmed = dict(node)
+    if depth <= 0:
+        trimmed.pop('replies', None)
+    elif node.get('replies'):
+        trimmed['replies'] = [_trim_replies(reply, depth - 1) for reply in node['replies']]
+    return trimmed
+
+
+def _trim_parents(node, parent_height):
+    """Copy a thread node keeping only `parent_height` levels of parents."""
+    trimmed = dict(node)
+    if parent_height <= 0:
+        trimmed.pop('parent', None)
+    elif node.get('parent'):
+        trimmed['parent'] = _trim_parents(node['parent'], parent_height - 1)
+    return trimmed
+
+
+class ThreadCache:
+    """Short-lived cache of getPostThread results keyed by URI.
+
+    Each entry remembers the depth and parentHeight it was fetched with, so a
+    deeper cached thread can answer a shallower request."""
+
+    def __init__(self, ttl=60, maxsize=256):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # uri -> (thread, depth, parent_height, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, uri, depth, parent_height):
+        """Return the cached thread trimmed to depth/parent_height, or None."""
+        with self._lock:
+            entry = self._data.get(uri)
+            if entry is None:
+                return None
+            thread, cached_depth, cached_parent_height, expires_at = entry
+            if expires_at < time.time():
+                del self._data[uri]
+                return None
+            if cached_depth < depth or cached_parent_height < parent_height:
+                return None
+            self._data.move_to_end(uri)
+        if cached_depth > depth:
+            thread = _trim_replies(thread, depth)
+        if cached_parent_height > parent_height:
+            thread = _trim_parents(thread, parent_height)
+        return thread
+
+    def set(self, uri, thread, depth, parent_height):
+        """Store a thread unless a deeper unexpired copy is already cached."""
+        with self._lock:
+            entry = self._data.get(uri)
+            if entry is not None:
+                _, cached_depth, cached_parent_height, expires_at = entry
+                if (expires_at >= time.time() and
+                        cached_depth >= depth and cached_parent_height >= parent_height):
+                    return
+            self._data[uri] = (thread, depth, parent_height, time.time() + self.ttl)
+            self._data.move_to_end(uri)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, uri):
+        """Drop a cached thread, e.g. after replying to it."""
+        with self._lock:
+            self._data.pop(uri, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class EmbeddingCache:
+    """On-disk embedding cache keyed by a hash of the model name and text.
+
+    Vectors are stored as float32 blobs in SQLite. When the cache grows past
+    `max_entries`, the least recently used embeddings are evicted."""
+
+    def __init__(self, path='embedding_cache.db', max_entries=20000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model, text):
+        return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, model, texts):
+        """Return {text: embedding list} for every text found in the cache."""
+        keys = {self.make_key(model, text): text for text in texts}
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            key_list = list(keys)
+            # Stay under SQLite's host parameter limit
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[keys[key]] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, self.make_key(model, text)) for text in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, model, items):
+        """Store (text, embedding) pairs and evict old entries if the cache is full."""
+        if not items:
+            return
+        now = time.time()
+        rows = [(self.make_key(model, text), np.asarray(embedding, dtype=np.float32).tobytes(), now)
+                for text, embedding in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+
+
+class CompletionCache:
+    """On-disk cache of chat completions keyed by a hash of the request.
+
+    Responses are stored as JSON in SQLite. Entries older than `ttl` seconds
+    are ignored (ttl=None keeps them forever) and the least recently used
+    entries are evicted past `max_entries`."""
+
+    def __init__(self, path='llm_cache.db', ttl=None, max_entries=5000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_completions_last_used ON completions(last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(request):
+        """Hash a request dict (model, messages and sampling parameters)."""
+        payload = json.dumps(request, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key, ignore_ttl=False):
+        """Return the cached response JSON for key, or None if missing or expired."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if not ignore_ttl and self.ttl and created_at < time.time() - self.ttl:
+                return None
+            self._conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return response
+
+    def put(self, key, response):
+        """Store response JSON under key and evict old entries if the cache is full."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, response, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now)
+            )
+            count = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM completions WHERE key IN "
+                    "(SELECT key FROM completions ORDER BY last_used ASC LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
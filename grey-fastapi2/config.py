@@ -1,3 +1,4 @@
+import os
 from datetime import time
 import pytz
 
@@ -9,6 +10,99 @@ THREAD_POST_INTERVAL = 2700  # 45 minutes in seconds
 CHECK_INTERVAL = 60  # 1 minute in seconds
 NEWS_POST_INTERVAL = 7200  # 2 hours in seconds
 MEME_ENGAGEMENT_INTERVAL = 2400  # 30 minutes
+MEMORY_CHECK_INTERVAL = 30  # How often the memory job checks for its update time (seconds)
+
+# Bluesky XRPC client settings
+XRPC_BASE_URL = "https://bsky.social"
+XRPC_CONNECT_TIMEOUT = 5  # seconds
+XRPC_READ_TIMEOUT = 30  # seconds
+XRPC_MAX_RETRIES = 3  # Retries for idempotent requests on connection errors / 5xx
+XRPC_RATE_LIMIT = 10  # Initial requests per second per host, until RateLimit headers are seen
+XRPC_RATE_BURST = 10  # Requests that may be sent at once before rate limiting kicks in
+XRPC_RATE_MIN = 0.5  # Slowest rate the adaptive limiter will drop to (requests per second)
+XRPC_RATE_MAX = 50  # Fastest rate the adaptive limiter will speed up to (requests per second)
+XRPC_RATE_RESERVE = 5  # Pause until the window resets when this few requests remain
+
+# Session token lifecycle
+TOKEN_REFRESH_MARGIN = 300  # Refresh the access token 5 minutes before it expires
+TOKEN_DEFAULT_LIFETIME = 3600  # Assumed token lifetime when the JWT has no readable expiry
+
+# Handle -> DID resolver cache
+DID_CACHE_SIZE = 5000  # Max cached handles
+DID_CACHE_TTL = 86400  # 24 hours in seconds
+DID_CACHE_FILE = 'did_cache.json'  # Set to None to keep the cache in memory only
+
+# How long fetched post threads are reused by all getPostThread callers (seconds)
+THREAD_CACHE_TTL = 60
+
+# Notification ingestion
+NOTIFICATION_REASONS = ['mention', 'reply', 'quote']  # Notification reasons the bot replies to
+NOTIFICATION_PAGE_SIZE = 100  # listNotifications page size (API maximum)
+NOTIFICATION_MAX_PAGES = 10  # Safety cap on pages fetched per check
+NOTIFICATION_WORKERS = 4  # Threads processed in parallel (notifications within a thread stay in order)
+LLM_MAX_CONCURRENCY = 3  # Max LLM calls the notification workers make at once
+MEMORY_RETRIEVAL_BUDGET = 1.5  # Seconds a reply waits for memory lookup before going out without it
+MEMORY_PREFETCH_WORKERS = 4  # Memory lookups run in parallel with thread fetches
+
+# Durable bot state (dedup sets, notification high-water mark)
+STATE_DB_FILE = 'bot_state.db'  # SQLite database; replaces used_content.json and used_meme_responses.json
+USED_POSTS_TTL = 30 * 86400  # Viral posts and news items are not reused for 30 days
+USED_TOPICS_TTL = 14 * 86400  # Thread topics are not repeated for 14 days
+TOPIC_NOVELTY_WINDOW = 50  # Most recent topics a new thread topic is compared against
+TOPIC_SIMILARITY_THRESHOLD = 0.85  # Embedding cosine similarity at which a topic counts as a repeat
+USED_MEME_RESPONSES_TTL = 90 * 86400  # Posts we replied to with a meme are skipped for 90 days
+
+# Memory vector store: 'pinecone' or 'local' (in-process NumPy index, no external service)
+VECTOR_STORE_BACKEND = os.getenv('VECTOR_STORE_BACKEND', 'pinecone')
+PINECONE_INDEX_NAME = "greybot-memory"
+LOCAL_VECTOR_STORE_PATH = 'memory_vectors'  # Writes memory_vectors.npy + memory_vectors.meta.json
+
+# Embeddings for the memory index
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSION = 1536
+EMBEDDING_MAX_BATCH_SIZE = 2048  # Max inputs per embeddings request (API limit)
+EMBEDDING_MAX_BATCH_TOKENS = 100000  # Estimated tokens per embeddings request (API limit is 300k)
+EMBEDDING_MAX_RETRIES = 3  # Attempts per sub-batch before splitting it to isolate failures
+EMBEDDING_CACHE_FILE = 'embedding_cache.db'  # SQLite cache of embeddings keyed by model + text hash
+EMBEDDING_CACHE_MAX_ENTRIES = 20000  # About 6 KB per embedding; least recently used are evicted
+QUERY_CACHE_SIZE = 512  # Memory search queries whose embeddings and results are kept in process
+QUERY_CACHE_TTL = 3600  # seconds
+
+# Token budgets for thread context in prompts (the rest of the thread is trimmed by relevance)
+PROMPT_TOKENIZER_MODEL = "gpt-4o-mini"
+REPLY_CONTEXT_TOKEN_BUDGET = 2000  # Thread context tokens in notification replies
+MEME_CONTEXT_TOKEN_BUDGET = 800  # Thread context tokens in meme replies
+
+# Meme replies
+MEME_CANDIDATES = 3  # Completions requested per call; the best one passing validation is used
+MEME_MAX_ATTEMPTS = 2  # Calls made before falling back to the best partial candidate
+
+# LLM completion cache: 'off', 'cache' (only temperature 0 requests), 'record' (save every
+# completion) or 'replay' (serve only recorded completions, for offline runs and benchmarks)
+LLM_CACHE_MODE = os.getenv('LLM_CACHE_MODE', 'cache')
+LLM_CACHE_FILE = 'llm_cache.db'
+LLM_CACHE_TTL = 7 * 86400  # Cached completions are reused for 7 days (replay ignores this)
+LLM_CACHE_MAX_ENTRIES = 5000  # Least recently used completions are evicted past this
+
+# Number of keyword searches run at the same time when scanning for viral posts
+TREND_SCAN_CONCURRENCY = 8
+
+# Pooled keep-alive connections to bsky.social: one per trend scan and notification
+# worker, plus the news, meme, memory and session jobs running alongside them
+XRPC_POOL_SIZE = TREND_SCAN_CONCURRENCY + NOTIFICATION_WORKERS + 4
+
+# Memory maintenance: new posts are indexed as they are published; the daily
+# update window only evicts old memories unless a full rebuild is due.
+# Rebuilds fill a fresh namespace and swap readers over, so the bot never pauses
+MEMORY_RETENTION_DAYS = 90  # Memories older than this are evicted
+MEMORY_REBUILD_INTERVAL_DAYS = 30  # Full rebuild (repair) at most this often
+MEMORY_STATE_FILE = 'memory_state.json'  # Persisted last rebuild time and active/previous namespaces
+MEMORY_REBUILD_MIN_RATIO = 0.9  # Share of fetched posts a rebuild must store before readers switch to it
+MEMORY_PIPELINE_QUEUE_SIZE = 2  # Feed pages buffered between the fetch, embed and upsert stages of a rebuild
+MEMORY_UPSERT_BATCH_SIZE = 50  # Vectors per upsert request
+MEMORY_UPSERT_CONCURRENCY = 4  # Upsert requests sent at the same time
+MEMORY_UPSERT_RETRIES = 3  # Attempts per upsert batch, with exponential backoff between them
+MEMORY_COUNT_CONFIRM_TIMEOUT = 10  # Seconds to wait for index stats to catch up after a rebuild
 
 # # Define memory update interval
 #     MEMORY_UPDATE_INTERVAL = 86400  # 24 hours in seconds (24 * 60 * 60)
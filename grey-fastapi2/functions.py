@@ -1,31 +1,88 @@
 import requests
 import pandas as pd
+import numpy as np
+import re
 from datetime import datetime, timedelta
 import pytz
 import time
 import os
 from typing import Optional
-from config import MEMORY_UPDATE_TIME, MEMORY_UPDATE_TIMEZONE
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from config import (MEMORY_UPDATE_TIME,
+                    MEMORY_UPDATE_TIMEZONE,
+                    TREND_SCAN_CONCURRENCY,
+                    DID_CACHE_SIZE,
+                    DID_CACHE_TTL,
+                    DID_CACHE_FILE,
+                    THREAD_CACHE_TTL,
+                    NOTIFICATION_REASONS,
+                    NOTIFICATION_PAGE_SIZE,
+                    NOTIFICATION_MAX_PAGES,
+                    STATE_DB_FILE,
+                    NOTIFICATION_WORKERS,
+                    LLM_MAX_CONCURRENCY,
+                    MEMORY_RETRIEVAL_BUDGET,
+                    MEMORY_PREFETCH_WORKERS,
+                    TOPIC_SIMILARITY_THRESHOLD,
+                    TOPIC_NOVELTY_WINDOW,
+                    MEME_CANDIDATES,
+                    MEME_MAX_ATTEMPTS,
+                    REPLY_CONTEXT_TOKEN_BUDGET,
+                    MEME_CONTEXT_TOKEN_BUDGET)
+from xrpc import xrpc
+from cache import TTLCache, ThreadCache
+from state import StateStore, hash_key
+from token_budget import budget_thread_context, format_thread_post
 import feedparser
 from bs4 import BeautifulSoup
 import json
 import hashlib
 import random
 import traceback
+import threading
 
 
+# Handle -> DID resolutions shared by get_bot_did and get_user_did
+did_cache = TTLCache(maxsize=DID_CACHE_SIZE, ttl=DID_CACHE_TTL, persist_path=DID_CACHE_FILE)
 
-def get_post_thread(token, post_uri):
-    """Retrieve the thread (including replies) for a specific post."""
-    url = "https://bsky.social/xrpc/app.bsky.feed.getPostThread"
+# Dedup sets and other durable bot state
+state_store = StateStore(STATE_DB_FILE)
+
+# getPostThread results shared by every thread lookup within a cycle
+thread_cache = ThreadCache(ttl=THREAD_CACHE_TTL)
+
+# Limits concurrent LLM calls from the notification workers
+llm_semaphore = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# Runs memory lookups alongside the thread fetch on the reply path
+memory_executor = ThreadPoolExecutor(max_workers=MEMORY_PREFETCH_WORKERS, thread_name_prefix="memory-prefetch")
+
+def fetch_post_thread(token, post_uri, depth=6, parent_height=80):
+    """Fetch a post thread through the shared thread cache.
+    Defaults match the getPostThread API defaults. Returns (thread, response);
+    response is None on a cache hit and thread is None on failure."""
+    thread_data = thread_cache.get(post_uri, depth, parent_height)
+    if thread_data is not None:
+        return thread_data, None
+    
     params = {
         "uri": post_uri,
-        "depth": 10  # Get 10 level deeper replies
+        "depth": depth,
+        "parentHeight": parent_height
     }
-    response = requests.get(url, headers={"Authorization": f"Bearer {token}"}, params=params)
+    response = xrpc.get("app.bsky.feed.getPostThread", params=params, token=token)
     
     if response.status_code == 200:
         thread_data = response.json().get('thread', {})
+        thread_cache.set(post_uri, thread_data, depth, parent_height)
+        return thread_data, response
+    return None, response
+
+def get_post_thread(token, post_uri):
+    """Retrieve the thread (including replies) for a specific post."""
+    thread_data, response = fetch_post_thread(token, post_uri, depth=10)  # Get 10 level deeper replies
+    
+    if thread_data is not None:
         # Extract post CID from the response
         post_cid = thread_data.get('post', {}).get('cid')
         return thread_data, post_cid
@@ -114,20 +171,31 @@ def convert_to_ist(utc_time_str):
 #         print(f"Error in search_mentions: {str(e)}")
 #         return None
 
-def get_bot_did(token, handle):
-    """Get the DID for a given handle."""
-    url = "https://bsky.social/xrpc/com.atproto.identity.resolveHandle"
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
+def resolve_handle(token, handle):
+    """Resolve a handle to its DID, using the shared resolver cache.
+    Returns (did, response); response is None on a cache hit."""
+    did = did_cache.get(handle)
+    if did:
+        return did, None
+    
     params = {
         "handle": handle
     }
     
-    response = requests.get(url, headers=headers, params=params)
+    response = xrpc.get("com.atproto.identity.resolveHandle", params=params, token=token)
     if response.status_code == 200:
         did = response.json().get('did')
-        print(f"Successfully retrieved DID for {handle}: {did}")
+        if did:
+            did_cache.set(handle, did)
+        return did, response
+    return None, response
+
+def get_bot_did(token, handle):
+    """Get the DID for a given handle."""
+    did, response = resolve_handle(token, handle)
+    if did:
+        if response is not None:
+            print(f"Successfully retrieved DID for {handle}: {did}")
         return did
     else:
         print(f"Failed to get DID: {response.status_code} - {response.text}")
@@ -135,18 +203,9 @@ def get_bot_did(token, handle):
 
 def get_post_info(token, post_uri):
     """Get post CID and other details."""
-    url = "https://bsky.social/xrpc/app.bsky.feed.getPostThread"
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
-    params = {
-        "uri": post_uri
-    }
-    
     try:
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code == 200:
-            thread = response.json().get('thread', {})
+        thread, _ = fetch_post_thread(token, post_uri)
+        if thread is not None:
             post_data = thread.get('post', {})
             
             # Check if this is a reply
@@ -201,26 +260,12 @@ def generate_response(post_content: str, client) -> Optional[str]:
 def post_reply(token, author_handle, post_content, post_uri, bot_did, client, ai_response, bot_memory, is_meme=False):
     """Post reply to the person who mentioned the bot."""
     try:
-        if bot_memory.should_force_stop():
-            print(f"\n🛑 FORCE STOP: Memory update time - Reply cancelled")
-            return False
-            
-        url = "https://bsky.social/xrpc/com.atproto.repo.createRecord"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
         # Get the thread info
-        thread_url = f"https://bsky.social/xrpc/app.bsky.feed.getPostThread"
-        thread_params = {"uri": post_uri}
-        thread_response = requests.get(thread_url, headers=headers, params=thread_params)
+        thread_data, thread_response = fetch_post_thread(token, post_uri)
         
-        if thread_response.status_code != 200:
+        if thread_data is None:
             print(f"Failed to get thread info: {thread_response.status_code}")
             return False
-            
-        thread_data = thread_response.json().get('thread', {})
         
         # The parent post will be the one containing the mention (where author_handle mentioned the bot)
         parent_uri = post_uri  # This is the URI of the mention/reply
@@ -291,10 +336,24 @@ def post_reply(token, author_handle, post_content, post_uri, bot_did, client, ai
         retry_count = 0
         
         while retry_count < max_retries:
-            response = requests.post(url, headers=headers, json=data)
+            response = xrpc.post("com.atproto.repo.createRecord", json=data, token=token)
             
             if response.status_code == 200:
                 print(f"✅ Successfully posted reply to @{author_handle}")
+                # The thread has a new reply now
+                thread_cache.invalidate(post_uri)
+                
+                # Add the reply to memory right away; the reply is posted even if this fails
+                try:
+                    bot_memory.remember_posts([{
+                        'uri': response.json()['uri'],
+                        'cid': response.json()['cid'],
+                        'text': reply_text,
+                        'created_at': data['record']['createdAt'],
+                        'position': 'meme' if is_meme else 'reply'
+                    }])
+                except Exception as e:
+                    print(f"Error adding reply to memory: {str(e)}")
                 return True
             elif response.status_code == 502:
                 retry_count += 1
@@ -314,32 +373,22 @@ def post_reply(token, author_handle, post_content, post_uri, bot_did, client, ai
 
 def get_user_did(token, handle):
     """Get user's DID from their handle."""
-    url = "https://bsky.social/xrpc/com.atproto.identity.resolveHandle"
-    headers = {
-        "Authorization": f"Bearer {token}"
-    }
-    params = {
-        "handle": handle
-    }
-    
     try:
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code == 200:
-            return response.json().get('did')
+        did, _ = resolve_handle(token, handle)
+        return did
     except Exception as e:
         print(f"Error getting user DID: {str(e)}")
     return None
 
 def get_auth_token():
     """Get fresh authentication tokens (access and refresh)."""
-    url = "https://bsky.social/xrpc/com.atproto.server.createSession"
     data = {
         "identifier": os.getenv('BSKY_IDENTIFIER'),
         "password": os.getenv('BSKY_PASSWORD')
     }
     
     try:
-        response = requests.post(url, json=data)
+        response = xrpc.post("com.atproto.server.createSession", json=data, auth=False)
         if response.status_code == 200:
             access_token = response.json().get('accessJwt')
             refresh_token = response.json().get('refreshJwt')
@@ -354,13 +403,8 @@ def get_auth_token():
 
 def refresh_access_token(refresh_token):
     """Get a new access token using the refresh token."""
-    url = "https://bsky.social/xrpc/com.atproto.server.refreshSession"
-    headers = {
-        "Authorization": f"Bearer {refresh_token}"
-    }
-    
     try:
-        response = requests.post(url, headers=headers)
+        response = xrpc.post("com.atproto.server.refreshSession", token=refresh_token, auth=False)
         if response.status_code == 200:
             new_access_token = response.json().get('accessJwt')
             new_refresh_token = response.json().get('refreshJwt')
@@ -373,31 +417,41 @@ def refresh_access_token(refresh_token):
         print(f"Exception during token refresh: {str(e)}")
         return None, None
 
-def get_viral_posts(token: str, used_posts: set, keywords: list) -> list:
+def search_posts(token, keyword, limit=50):
+    """Run a single searchPosts query and return the matching posts."""
+    params = {
+        "q": keyword,
+        "limit": limit
+    }
+    
+    response = xrpc.get("app.bsky.feed.searchPosts", params=params, token=token)
+    if response.status_code == 200:
+        return response.json().get('posts', [])
+    print(f"Search for '{keyword}' failed: {response.status_code}")
+    return []
+
+def get_viral_posts(token: str, used_posts: set, keywords: list, concurrency: int = TREND_SCAN_CONCURRENCY) -> list:
     """Search and retrieve viral posts from Bluesky based on provided keywords, filtering by engagement metrics 
     and excluding previously used posts. Posts must be within the last 6 hours and have significant engagement 
-    (likes, reposts, replies). Returns a list of the top 5 most engaging posts."""
+    (likes, reposts, replies). Keyword searches run concurrently (up to `concurrency` at a time) and results
+    are merged as they arrive. Returns a list of the top 5 most engaging posts."""
     
-    url = "https://bsky.social/xrpc/app.bsky.feed.searchPosts"
-    viral_posts = []
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+    # Candidates keyed by text to remove duplicates across keywords
+    viral_posts = {}
     
     try:
         # Get current time for filtering
         current_time = datetime.now(pytz.UTC)
         
-        for keyword in keywords:
-            params = {
-                "q": keyword,
-                "limit": 50
-            }
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            futures = {executor.submit(search_posts, token, keyword): keyword for keyword in keywords}
             
-            response = requests.get(url, headers=headers, params=params)
-            if response.status_code == 200:
-                posts = response.json().get('posts', [])
+            for future in as_completed(futures):
+                try:
+                    posts = future.result()
+                except Exception as e:
+                    print(f"Error searching for '{futures[future]}': {str(e)}")
+                    continue
                 
                 for post in posts:
                     # Skip if we've already used this post
@@ -421,29 +475,107 @@ def get_viral_posts(token: str, used_posts: set, keywords: list) -> list:
                     engagement = (likes + (reposts * 2) + replies) * time_factor
                     
                     if engagement > 10:
-                        viral_posts.append({
+                        viral_posts[post_text] = {
                             'text': post_text,
                             'engagement': engagement,
                             'author': post.get('author', {}).get('handle', ''),
                             'likes': likes,
                             'reposts': reposts,
                             'timestamp': post_time
-                        })
+                        }
         
-        # Remove duplicates and sort by engagement
-        unique_posts = {post['text']: post for post in viral_posts}.values()
-        return sorted(unique_posts, key=lambda x: x['engagement'], reverse=True)[:5]
+        # Sort by engagement
+        return sorted(viral_posts.values(), key=lambda x: x['engagement'], reverse=True)[:5]
         
     except Exception as e:
         print(f"Error getting viral posts: {str(e)}")
         return []
 
-def generate_thread_content(viral_posts: list, used_topics: set, client) -> list:
+def find_similar_topic(topic, recent_topics, bot_memory=None, threshold=TOPIC_SIMILARITY_THRESHOLD):
+    """Return the recently covered topic that topic repeats, or None if it is new.
+    Topics are compared by embedding cosine similarity (embeddings come from the
+    memory's on-disk cache after the first lookup); without bot_memory only
+    case-insensitive exact matches count."""
+    if not recent_topics:
+        return None
+    for recent_topic in recent_topics:
+        if recent_topic.strip().lower() == topic.strip().lower():
+            return recent_topic
+    if bot_memory is None:
+        return None
+    
+    try:
+        embeddings = bot_memory.embed_texts([topic] + list(recent_topics))
+        if embeddings[0] is None:
+            return None
+        candidates = [(recent_topic, embedding) for recent_topic, embedding in zip(recent_topics, embeddings[1:])
+                      if embedding is not None]
+        if not candidates:
+            return None
+        
+        query = np.asarray(embeddings[0], dtype=np.float32)
+        matrix = np.asarray([embedding for _, embedding in candidates], dtype=np.float32)
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-9)
+        best = int(np.argmax(scores))
+        if scores[best] >= threshold:
+            print(f"Topic '{topic}' is {scores[best]:.2f} similar to recent topic '{candidates[best][0]}'")
+            return candidates[best][0]
+        return None
+    except Exception as e:
+        print(f"Error checking topic novelty: {str(e)}")
+        return None
+
+# Structured output for generate_thread_content: the topic and the thread in one response
+THREAD_CONTENT_SCHEMA = {
+    "name": "trending_thread",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "topic": {"type": "string", "description": "The single most significant trending topic"},
+            "posts": {"type": "array", "items": {"type": "string"}, "description": "The thread, 4-5 posts"}
+        },
+        "required": ["topic", "posts"],
+        "additionalProperties": False
+    }
+}
+
+def parse_thread_content(content):
+    """Validate a structured thread response. Returns (topic, posts) or (None, None)."""
+    try:
+        data = json.loads(content)
+    except (ValueError, TypeError) as e:
+        print(f"Invalid thread content: {str(e)}")
+        return None, None
+    
+    topic = data.get('topic') if isinstance(data, dict) else None
+    posts = data.get('posts') if isinstance(data, dict) else None
+    if (not isinstance(topic, str) or not isinstance(posts, list) or
+            not all(isinstance(post, str) for post in posts)):
+        print("Invalid thread content: expected a string topic and a list of string posts")
+        return None, None
+    
+    topic = topic.strip()
+    posts = [post.strip() for post in posts if post.strip()]
+    if not topic or len(posts) < 2:
+        print(f"Invalid thread content: topic '{topic}' with {len(posts)} posts")
+        return None, None
+    
+    thread_posts = []
+    for post in posts:
+        if len(post) > 280:
+            post = post[:277] + "..."
+        thread_posts.append(post)
+    return topic, thread_posts
+
+def generate_thread_content(viral_posts: list, used_topics, client, bot_memory=None):
     """Generate a cohesive thread of 4-5 posts about a trending topic identified from the viral posts.
-    Uses OpenAI to identify the main topic and create engaging, informative content.
-    Ensures no duplicate topics and maintains post length limits."""
+    A single structured-output call names the topic and writes the thread; recently
+    covered topics are listed in the prompt so the model avoids them, and the returned
+    topic is still checked for similarity against them.
+    Returns (topic, posts), or (None, None) if no new thread was generated."""
     if not viral_posts:
-        return None
+        return None, None
     
     posts_content = "\n\n".join([
         f"Post by @{post['author']}:\n{post['text']}\n"
@@ -451,36 +583,21 @@ def generate_thread_content(viral_posts: list, used_topics: set, client) -> list
         for post in viral_posts
     ])
     
+    recent_topics = used_topics.recent(TOPIC_NOVELTY_WINDOW)
+    avoid_topics = "\n".join(f"- {topic}" for topic in recent_topics) or "- (none)"
+    
     try:
-        # First, identify the main trending topic
-        topic_response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are an analyst. Identify the single most significant "
-                                            "and trending topic from the provided posts. Respond with just "
-                                            "the topic name, no explanation."},
-                {"role": "user", "content": f"What's the main trending topic in these posts?\n\n{posts_content}"}
-            ],
-            max_tokens=50,
-            temperature=0.3
-        )
-        
-        main_topic = topic_response.choices[0].message.content.strip()
-        
-        # Skip if we've recently covered this topic
-        if main_topic in used_topics:
-            print(f"Topic '{main_topic}' was recently covered, skipping...")
-            return None
-        
-        # Now generate a focused thread about this topic
         response = client.chat.completions.create(
             model="gpt-4o-mini",
             messages=[
-                {"role": "system", "content": f"""You are an expert creating a focused thread about {main_topic}.
-                Create a thread of 4-5 posts that deeply analyzes this specific topic. The thread should:
+                {"role": "system", "content": f"""You are an expert analyst and writer. First identify the single
+                most significant and trending topic from the provided posts, avoiding topics we covered recently:
+                {avoid_topics}
                 
-                1. Start with an introduction to {main_topic}. Begin with a compelling hook that grabs attention.
-                2. Each subsequent post should explore a different aspect of {main_topic}
+                Then create a thread of 4-5 posts that deeply analyzes this specific topic. The thread should:
+                
+                1. Start with an introduction to the topic. Begin with a compelling hook that grabs attention.
+                2. Each subsequent post should explore a different aspect of the topic
                 3. Conclude with an open-ended question that encourages discussion.
                 4. Incorporate relevant hashtags to increase visibility
                 5. Avoid using terms like Key details, conclusions, Final thoughts etc so that it flows naturally.
@@ -488,34 +605,33 @@ def generate_thread_content(viral_posts: list, used_topics: set, client) -> list
                 Each post MUST:
                 - Be under 280 characters
                 - Flow naturally from one post to the next
-                - Stay strictly focused on {main_topic}
+                - Stay strictly focused on the topic
                 - Use minimal emojis (1-2 per post)
                 - Include relevant hashtags only in the final post
                 
-                Format as: 'POST 1:', 'POST 2:', etc."""},
-                {"role": "user", "content": f"Create a focused thread about {main_topic}, using insights from these posts:\n\n{posts_content}"}
+                Return the topic name (no explanation) and the posts without numbering."""},
+                {"role": "user", "content": f"Create a focused thread about the main trending topic in these posts:\n\n{posts_content}"}
             ],
+            response_format={"type": "json_schema", "json_schema": THREAD_CONTENT_SCHEMA},
             max_tokens=1000,
             temperature=0.7
         )
         
-        # Split and clean the posts
-        content = response.choices[0].message.content.strip()
-        raw_posts = [p.strip() for p in content.split('POST') if p.strip()]
+        main_topic, thread_posts = parse_thread_content(response.choices[0].message.content)
+        if not thread_posts:
+            return None, None
         
-        thread_posts = []
-        for post in raw_posts:
-            clean_post = post.split(':', 1)[-1].strip()
-            if len(clean_post) > 280:
-                clean_post = clean_post[:277] + "..."
-            thread_posts.append(clean_post)
+        # The prompt steers away from recent topics; make sure it did
+        if find_similar_topic(main_topic, recent_topics, bot_memory):
+            print(f"Topic '{main_topic}' was recently covered, skipping...")
+            return None, None
         
         print(f"Generated thread about: {main_topic}")
-        return thread_posts
+        return main_topic, thread_posts
         
     except Exception as e:
         print(f"Error generating thread content: {str(e)}")
-        return None
+        return None, None
 
 def upload_image_to_bsky(token: str, image_url: str) -> Optional[dict]:
     """Download image from URL and upload to Bluesky's blob storage."""
@@ -524,7 +640,7 @@ def upload_image_to_bsky(token: str, image_url: str) -> Optional[dict]:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
-        img_response = requests.get(image_url, headers=headers)
+        img_response = requests.get(image_url, headers=headers, timeout=10)
         if img_response.status_code != 200:
             print(f"Failed to download image: {img_response.status_code}")
             return None
@@ -533,16 +649,11 @@ def upload_image_to_bsky(token: str, image_url: str) -> Optional[dict]:
         content_type = img_response.headers.get('content-type', 'image/jpeg')
         
         # Upload to Bluesky
-        upload_url = "https://bsky.social/xrpc/com.atproto.repo.uploadBlob"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": content_type
-        }
-        
-        upload_response = requests.post(
-            upload_url,
-            headers=headers,
-            data=img_response.content
+        upload_response = xrpc.post(
+            "com.atproto.repo.uploadBlob",
+            data=img_response.content,
+            token=token,
+            headers={"Content-Type": content_type}
         )
 
         if upload_response.status_code == 200:
@@ -626,15 +737,12 @@ def extract_article_content(url):
         print(f"Error extracting article content: {str(e)}")
         return None, None
 
-def post_thread(token: str, bot_did: str, thread_posts: list, embed_url: Optional[str] = None, image_url: Optional[str] = None) -> bool:
-    """Post a series of connected posts as a thread on Bluesky."""
-    url = "https://bsky.social/xrpc/com.atproto.repo.createRecord"
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-    
+def post_thread(token: str, bot_did: str, thread_posts: list, embed_url: Optional[str] = None, image_url: Optional[str] = None, bot_memory=None) -> bool:
+    """Post a series of connected posts as a thread on Bluesky.
+    If bot_memory is given, the posted thread is added to memory once it is complete."""
     try:
+        posted_records = []  # Published posts, for write-through memory indexing
+
         # Handle image upload if provided
         image_blob = None
         if image_url:
@@ -699,7 +807,7 @@ def post_thread(token: str, bot_did: str, thread_posts: list, embed_url: Optiona
                     print("Waiting for link preview to generate...")
                     time.sleep(10)
                 
-                response = requests.post(url, headers=headers, json=data)
+                response = xrpc.post("com.atproto.repo.createRecord", json=data, token=token)
                 
                 if response.status_code == 200:
                     print(f"Posted thread part {i+1}/{len(thread_posts)}")
@@ -710,6 +818,13 @@ def post_thread(token: str, bot_did: str, thread_posts: list, embed_url: Optiona
                     
                     parent_uri = response.json()['uri']
                     parent_cid = response.json()['cid']
+                    posted_records.append({
+                        'uri': parent_uri,
+                        'cid': parent_cid,
+                        'text': post_text,
+                        'created_at': data['record']['createdAt'],
+                        'position': 'main' if i == 0 else 'thread'
+                    })
                     
                     time.sleep(2)  # Small delay between posts
                     break  # Success, exit retry loop
@@ -727,6 +842,12 @@ def post_thread(token: str, bot_did: str, thread_posts: list, embed_url: Optiona
                     return False
         
         print("Successfully posted complete thread!")
+        if bot_memory:
+            # The thread is posted even if indexing it fails
+            try:
+                bot_memory.remember_posts(posted_records)
+            except Exception as e:
+                print(f"Error adding thread to memory: {str(e)}")
         return True
         
     except Exception as e:
@@ -734,13 +855,8 @@ def post_thread(token: str, bot_did: str, thread_posts: list, embed_url: Optiona
         return False
 
 def post_trending_content(access_token, bot_did, used_posts, used_topics, client, keywords, bot_memory):
-    """Post trending content with force stop check."""
+    """Post a thread about trending AI content."""
     try:
-        # Initial check
-        if bot_memory.should_force_stop():
-            print(f"\n🛑 FORCE STOP: Memory update time - Thread posting cancelled")
-            return False
-
         # Get viral posts
         print("Finding viral posts...")
         viral_posts = get_viral_posts(access_token, used_posts, keywords)
@@ -751,7 +867,7 @@ def post_trending_content(access_token, bot_did, used_posts, used_topics, client
         
         # Generate thread content
         print("Generating thread content...")
-        thread_posts = generate_thread_content(viral_posts, used_topics, client)
+        main_topic, thread_posts = generate_thread_content(viral_posts, used_topics, client, bot_memory)
         
         if not thread_posts:
             print("Failed to generate thread content")
@@ -763,22 +879,14 @@ def post_trending_content(access_token, bot_did, used_posts, used_topics, client
         
         # Post the thread
         print("Posting thread...")
-        success = post_thread(access_token, bot_did, thread_posts)
+        success = post_thread(access_token, bot_did, thread_posts, bot_memory=bot_memory)
         
         if success:
             # Update tracking sets
             for post in viral_posts:
                 used_posts.add(post['text'])
-            # Extract main topic from first post
-            main_topic = thread_posts[0].split()[0:3]
-            used_topics.add(" ".join(main_topic))
+            used_topics.add(main_topic)
             
-            # Limit set sizes
-            if len(used_posts) > 1000:
-                used_posts.clear()
-            if len(used_topics) > 100:
-                used_topics.clear()
-                
             print("Successfully posted unique content")
             return True
         else:
@@ -792,22 +900,16 @@ def post_trending_content(access_token, bot_did, used_posts, used_topics, client
 def get_full_thread_context(token, post_uri, client_atproto):
     """Get the complete thread context including all parent posts and replies."""
     try:
-        url = "https://bsky.social/xrpc/app.bsky.feed.getPostThread"
-        headers = {
-            "Authorization": f"Bearer {token}"
-        }
-        params = {
-            "uri": post_uri,
-            "depth": 100,      # Increased depth for more replies
-            "parentHeight": 100  # Added to get full parent context
-        }
-        
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code != 200:
+        thread_data, response = fetch_post_thread(
+            token,
+            post_uri,
+            depth=100,         # Increased depth for more replies
+            parent_height=100  # Added to get full parent context
+        )
+        if thread_data is None:
             print(f"Failed to get thread: {response.status_code}")
             return None
             
-        thread_data = response.json().get('thread', {})
         thread_context = []
         
         def extract_post_data(post_data, depth=0, post_type="reply"):
@@ -889,112 +991,225 @@ def get_reply_details(notification):
         print(f"Error getting reply details: {str(e)}")
         return None, None
 
-def check_notifications(token, client, client_atproto, bot_memory):
-    """Check only unseen notifications and mark them as seen after processing."""
+def load_notification_state():
+    """Load the indexedAt high-water mark of the last processed notification."""
     try:
-        if bot_memory.should_force_stop():
-            print(f"\n🛑 FORCE STOP: Memory update time - Notifications check cancelled")
-            return
+        return state_store.get('notifications.last_seen')
+    except Exception as e:
+        print(f"Error loading notification state: {str(e)}")
+        return None
 
-        # First, get unread count and latest seen timestamp
-        seen_url = "https://bsky.social/xrpc/app.bsky.notification.getUnreadCount"
-        seen_response = requests.get(
-            seen_url, 
-            headers={"Authorization": f"Bearer {token}"}
-        )
-        
-        if seen_response.status_code != 200:
-            print(f"Failed to get unread count: {seen_response.status_code}")
-            return
-            
-        unread_count = seen_response.json().get('count', 0)
-        
-        if unread_count == 0:
-            print("No new notifications")
-            return
-            
-        # Get notifications
-        url = "https://bsky.social/xrpc/app.bsky.notification.listNotifications"
-        params = {"limit": 50}
-        headers = {"Authorization": f"Bearer {token}"}
+def save_notification_state(last_seen):
+    """Persist the indexedAt high-water mark of the last processed notification."""
+    try:
+        state_store.set('notifications.last_seen', last_seen)
+    except Exception as e:
+        print(f"Error saving notification state: {str(e)}")
+
+def load_notification_backlog():
+    """Load the resume point of a burst that didn't fit in NOTIFICATION_MAX_PAGES."""
+    try:
+        return state_store.get('notifications.backlog')
+    except Exception as e:
+        print(f"Error loading notification backlog: {str(e)}")
+        return None
+
+def save_notification_backlog(backlog):
+    """Persist (or clear, with None) the resume point of an unfinished burst."""
+    try:
+        state_store.set('notifications.backlog', backlog)
+    except Exception as e:
+        print(f"Error saving notification backlog: {str(e)}")
+
+def fetch_new_notifications(token, last_seen, cursor=None):
+    """Page through listNotifications with cursors until reaching the high-water mark.
+    Only the reasons in NOTIFICATION_REASONS are requested. Without a high-water mark,
+    paging stops at the first notification already marked as read. Paging starts at
+    cursor when resuming a burst.
+    Returns (notifications oldest first, next cursor), where next cursor is set when
+    NOTIFICATION_MAX_PAGES ran out before the high-water mark was reached, or
+    (None, None) if a page could not be fetched."""
+    new_notifications = []
+    next_cursor = None
+    
+    for page in range(NOTIFICATION_MAX_PAGES):
+        params = {
+            "limit": NOTIFICATION_PAGE_SIZE,
+            "reasons": NOTIFICATION_REASONS
+        }
+        if cursor:
+            params["cursor"] = cursor
         
-        response = requests.get(url, headers=headers, params=params)
+        response = xrpc.get("app.bsky.notification.listNotifications", params=params, token=token)
         if response.status_code != 200:
             print(f"Failed to get notifications: {response.status_code}")
-            return
-            
-        notifications = response.json().get('notifications', [])
-        print(f"\n📬 Found {unread_count} unread notifications")
+            return None, None
         
-        # Track the latest notification timestamp
-        latest_seen = None
+        data = response.json()
+        notifications = data.get('notifications', [])
         
-        # Process notifications
-        for notif in notifications[:unread_count]:
-            try:
-                reason = notif.get('reason')
-                author = notif.get('author', {}).get('handle')
-                text = notif.get('record', {}).get('text', '')
-                current_timestamp = notif.get('indexedAt')
-                
-                # Update latest seen timestamp
-                if not latest_seen or current_timestamp > latest_seen:
-                    latest_seen = current_timestamp
-                
-                # Print notification details
-                notification_types = {
-                    'like': '❤️ LIKE',
-                    'repost': '🔄 REPOST',
-                    'follow': '👥 FOLLOW',
-                    'mention': '📣 MENTION',
-                    'reply': '💬 REPLY',
-                    'quote': '💭 QUOTE'
-                }
-                
-                notif_type = notification_types.get(reason, f'❓ {reason.upper()}')
-                print(f"\n{'='*50}")
-                print(f"\n{notif_type} from @{author}")
-                print(f"Content: {text[:100]}{'...' if len(text) > 100 else ''}")
-                print(f"Timestamp: {current_timestamp}")
+        reached_seen = False
+        for notif in notifications:
+            indexed_at = notif.get('indexedAt', '')
+            if (last_seen and indexed_at <= last_seen) or (not last_seen and notif.get('isRead')):
+                reached_seen = True
+                break
+            new_notifications.append(notif)
+        
+        cursor = data.get('cursor')
+        if reached_seen or not cursor or not notifications:
+            break
+    else:
+        # Older notifications are left for the next check, starting from this cursor
+        print(f"⚠️ Stopped after {NOTIFICATION_MAX_PAGES} pages of notifications, resuming next check")
+        next_cursor = cursor
+    
+    # Process in the order they arrived
+    new_notifications.reverse()
+    return new_notifications, next_cursor
+
+def get_thread_root_uri(notif):
+    """Return the URI of the root post of the thread a notification belongs to."""
+    reply = notif.get('record', {}).get('reply') or {}
+    return reply.get('root', {}).get('uri') or notif.get('uri')
+
+def wait_for_memories(memory_future, index, deadline):
+    """Return one notification's memories from a prefetched batch if it is ready before
+    the deadline, otherwise none. A late lookup keeps running in the background and
+    fills the query cache."""
+    try:
+        return memory_future.result(timeout=max(0, deadline - time.monotonic()))[index] or []
+    except FutureTimeoutError:
+        print(f"⏱️ Memory lookup exceeded {MEMORY_RETRIEVAL_BUDGET}s budget, replying without it")
+    except Exception as e:
+        print(f"Error retrieving memories: {str(e)}")
+    return []
+
+def handle_notification(token, notif, client, client_atproto, bot_memory, memory_future, memory_index):
+    """Print a notification and reply to it if it is a mention, reply or quote.
+    Memories come from the batch lookup started in check_notifications."""
+    try:
+        reason = notif.get('reason')
+        author = notif.get('author', {}).get('handle')
+        text = notif.get('record', {}).get('text', '')
+        current_timestamp = notif.get('indexedAt')
+        
+        # Print notification details
+        notification_types = {
+            'like': '❤️ LIKE',
+            'repost': '🔄 REPOST',
+            'follow': '👥 FOLLOW',
+            'mention': '📣 MENTION',
+            'reply': '💬 REPLY',
+            'quote': '💭 QUOTE'
+        }
+        
+        notif_type = notification_types.get(reason, f'❓ {reason.upper()}')
+        print(f"\n{'='*50}")
+        print(f"\n{notif_type} from @{author}")
+        print(f"Content: {text[:100]}{'...' if len(text) > 100 else ''}")
+        print(f"Timestamp: {current_timestamp}")
+        
+        # Process mentions, replies and quotes
+        if reason in NOTIFICATION_REASONS:
+            uri = notif.get('uri')
+            print(f"\n🤖 Processing {reason}...")
+            
+            # The memory lookup keeps running while the thread is being fetched
+            deadline = time.monotonic() + MEMORY_RETRIEVAL_BUDGET
+            
+            thread_context = get_full_thread_context(token, uri, client_atproto)
+            if thread_context:
+                success = process_notification(
+                    token=token,
+                    notif=notif,
+                    thread_context=thread_context,
+                    client=client,
+                    bot_memory=bot_memory,
+                    bot_did=get_bot_did(token, os.getenv('BSKY_IDENTIFIER')),
+                    memories=wait_for_memories(memory_future, memory_index, deadline)
+                )
                 
-                # Process mentions and replies
-                if reason in ['mention', 'reply']:
-                    uri = notif.get('uri')
-                    print(f"\n🤖 Processing {reason}...")
-                    
-                    thread_context = get_full_thread_context(token, uri, client_atproto)
-                    if thread_context:
-                        success = process_notification(
-                            token=token,
-                            notif=notif,
-                            thread_context=thread_context,
-                            client=client,
-                            bot_memory=bot_memory,
-                            bot_did=get_bot_did(token, os.getenv('BSKY_IDENTIFIER'))
-                        )
-                        
-                        if success:
-                            print(f"\n✅ Successfully processed {reason} from @{author}")
-                        else:
-                            print(f"\n❌ Failed to process {reason} from @{author}")
+                if success:
+                    print(f"\n✅ Successfully processed {reason} from @{author}")
                 else:
-                    print(f"⏩ Skipping {notif_type} (not a mention or reply)")
-                
-            except Exception as e:
-                print(f"\n❌ Error processing notification: {str(e)}")
-                continue
+                    print(f"\n❌ Failed to process {reason} from @{author}")
+        else:
+            print(f"⏩ Skipping {notif_type} (not a mention, reply or quote)")
+        
+    except Exception as e:
+        print(f"\n❌ Error processing notification: {str(e)}")
+
+def check_notifications(token, client, client_atproto, bot_memory):
+    """Check only unseen notifications and mark them as seen after processing."""
+    try:
+        # Get everything newer than the persisted high-water mark, continuing
+        # an unfinished burst from its saved cursor
+        last_seen = load_notification_state()
+        backlog = load_notification_backlog()
+        notifications, next_cursor = fetch_new_notifications(
+            token, last_seen, cursor=backlog['cursor'] if backlog else None
+        )
+        if notifications is None:
+            return
+        
+        # Track the latest notification timestamp (a burst's newest was seen on its first page)
+        latest_seen = max([notif.get('indexedAt', '') for notif in notifications] +
+                          [backlog['latest_seen'] if backlog else '']) or None
+        
+        if not notifications:
+            print("No new notifications")
+        else:
+            print(f"\n📬 Found {len(notifications)} new notifications")
+        
+        # Look up memories for every notification we reply to with a single batch
+        # embedding and search, started before any thread is fetched
+        replyable = [notif for notif in notifications if notif.get('reason') in NOTIFICATION_REASONS]
+        memory_future = None
+        if replyable:
+            memory_future = memory_executor.submit(
+                bot_memory.search_relevant_memories,
+                [notif.get('record', {}).get('text', '') for notif in replyable]
+            )
+        memory_indexes = {notif.get('uri'): i for i, notif in enumerate(replyable)}
+        
+        # Group notifications by root thread: threads are handled in parallel,
+        # notifications within a thread stay in order so the conversation stays coherent
+        threads = {}
+        for notif in notifications:
+            threads.setdefault(get_thread_root_uri(notif), []).append(notif)
+        
+        if threads:
+            print(f"Processing {len(threads)} threads with up to {NOTIFICATION_WORKERS} workers")
+        
+        def process_thread_notifications(thread_notifications):
+            for notif in thread_notifications:
+                handle_notification(token, notif, client, client_atproto, bot_memory,
+                                    memory_future, memory_indexes.get(notif.get('uri')))
+        
+        with ThreadPoolExecutor(max_workers=NOTIFICATION_WORKERS) as executor:
+            futures = [executor.submit(process_thread_notifications, thread_notifications)
+                       for thread_notifications in threads.values()]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"\n❌ Error processing notification thread: {str(e)}")
+        
+        # The high-water mark only moves once every page of a burst was processed
+        if next_cursor:
+            save_notification_backlog({'cursor': next_cursor, 'latest_seen': latest_seen})
+            return
+        if backlog:
+            save_notification_backlog(None)
         
         # Mark all processed notifications as seen at once
-        if latest_seen:
+        if latest_seen and latest_seen != last_seen:
+            save_notification_state(latest_seen)
             try:
-                mark_url = "https://bsky.social/xrpc/app.bsky.notification.updateSeen"
                 mark_data = {"seenAt": latest_seen}
-                mark_headers = {
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json"
-                }
                 
-                mark_response = requests.post(mark_url, headers=mark_headers, json=mark_data)
+                mark_response = xrpc.post("app.bsky.notification.updateSeen", json=mark_data, token=token)
                 
                 if mark_response.status_code == 200:
                     print(f"\n✅ Successfully marked all notifications as seen up to: {latest_seen}")
@@ -1007,8 +1222,9 @@ def check_notifications(token, client, client_atproto, bot_memory):
     except Exception as e:
         print(f"\n❌ Error in check_notifications: {str(e)}")
 
-def process_notification(token, notif, thread_context, client, bot_memory, bot_did):
-    """Process a single notification with full thread context."""
+def process_notification(token, notif, thread_context, client, bot_memory, bot_did, memories=None):
+    """Process a single notification with full thread context and, if given,
+    relevant past posts from the bot's memory."""
     try:
         author = notif.get('author', {}).get('handle')
         text = notif.get('record', {}).get('text', '')
@@ -1019,17 +1235,19 @@ def process_notification(token, notif, thread_context, client, bot_memory, bot_d
         print(f"For: {reason} from @{author}")
         print(f"Message: {text}")
         
-        # Format thread context for AI
-        thread_conversation = "\n\n".join([
-            f"[{post['type'].upper()} at depth {post['depth']}]\n"
-            f"@{post['author']}: {post['text']}"
-            for post in thread_context
-        ])
+        # Format thread context for AI, keeping the parts that matter within the token budget
+        thread_context, _ = budget_thread_context(thread_context, query=text, budget=REPLY_CONTEXT_TOKEN_BUDGET)
+        thread_conversation = "\n\n".join(format_thread_post(post) for post in thread_context)
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": """You are an AI expert and Social Media Influencer engaging in Bluesky conversations. 
+        # Past posts by the bot that relate to this conversation
+        memory_context = ""
+        if memories:
+            memory_context = "Your earlier posts on this topic (stay consistent, don't repeat them):\n" + "\n".join(
+                f"- {memory['text']}" for memory in memories
+            ) + "\n\n"
+        
+        messages = [
+            {"role": "system", "content": """You are an AI expert and Social Media Influencer engaging in Bluesky conversations. 
 
                 IMPORTANT GUIDELINES:
                 1. Be direct and natural - avoid typical bot phrases
@@ -1053,7 +1271,7 @@ def process_notification(token, notif, thread_context, client, bot_memory, bot_d
                 6. Focus on providing value immediately
                 
                 Remember: No pleasantries or bot-like phrases - just helpful, direct responses."""},
-                {"role": "user", "content": f"""Thread context:
+            {"role": "user", "content": memory_context + f"""Thread context:
 
                 {thread_conversation}
 
@@ -1069,10 +1287,16 @@ def process_notification(token, notif, thread_context, client, bot_memory, bot_d
                 4. Relevant to the conversation
                 
                 Generate response:"""}
-            ],
-            max_tokens=100,
-            temperature=0.7
-        )
+        ]
+        
+        # Cap how many notification workers wait on the LLM at once
+        with llm_semaphore:
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                max_tokens=100,
+                temperature=0.7
+            )
         
         ai_response = response.choices[0].message.content.strip()
         
@@ -1137,17 +1361,11 @@ def process_notification(token, notif, thread_context, client, bot_memory, bot_d
 def mark_notification_seen(token, seen_at):
     """Mark notifications as seen up to a specific timestamp."""
     try:
-        url = "https://bsky.social/xrpc/app.bsky.notification.updateSeen"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        
         data = {
             "seenAt": seen_at
         }
         
-        response = requests.post(url, headers=headers, json=data)
+        response = xrpc.post("app.bsky.notification.updateSeen", json=data, token=token)
         return response.status_code == 200
         
     except Exception as e:
@@ -1312,11 +1530,6 @@ def generate_news_thread(news_item, article_content, client):
 def post_ai_news(access_token, bot_did, used_posts, client, bot_memory):
     """Post AI news content with duplicate checking."""
     try:
-        # Check for force stop
-        if bot_memory.should_force_stop():
-            print(f"\n🛑 FORCE STOP: Memory update time - News posting cancelled")
-            return False
-        
         # Fetch recent AI news
         print("\nFetching recent AI news...")
         news_items = fetch_ai_news()
@@ -1354,7 +1567,8 @@ def post_ai_news(access_token, bot_did, used_posts, client, bot_memory):
                         bot_did, 
                         thread_posts, 
                         embed_url=news_item['link'],
-                        image_url=article_image
+                        image_url=article_image,
+                        bot_memory=bot_memory
                     )
                     
                     if success:
@@ -1375,38 +1589,68 @@ def post_ai_news(access_token, bot_did, used_posts, client, bot_memory):
         print(f"Error posting AI news: {str(e)}")
         return False
 
-def save_used_content(used_posts, used_topics, filename='used_content.json'):
-    """Save used content to prevent duplicates across restarts."""
+def migrate_json_state(store, used_content_file='used_content.json',
+                       used_meme_responses_file='used_meme_responses.json'):
+    """Import the legacy used_*.json files into the state store once."""
+    if store.get('migrated_json_state'):
+        return
     try:
-        content = {
-            'posts': list(used_posts),
-            'topics': list(used_topics)
-        }
-        with open(filename, 'w') as f:
-            json.dump(content, f)
-        print(f"Saved {len(used_posts)} used posts and {len(used_topics)} used topics")
+        if os.path.exists(used_content_file):
+            with open(used_content_file, 'r') as f:
+                content = json.load(f)
+            store.add_items('post', [f"{hash_key(post):016x}" for post in content.get('posts', [])])
+            store.add_items('topic', content.get('topics', []))
+            print(f"Imported {len(content.get('posts', []))} used posts and "
+                  f"{len(content.get('topics', []))} used topics from {used_content_file}")
+        
+        if os.path.exists(used_meme_responses_file):
+            with open(used_meme_responses_file, 'r') as f:
+                meme_responses = json.load(f)
+            store.add_items('meme_response', meme_responses)
+            print(f"Imported {len(meme_responses)} used meme responses from {used_meme_responses_file}")
+        
+        store.set('migrated_json_state', True)
     except Exception as e:
-        print(f"Error saving used content: {str(e)}")
+        print(f"Error migrating JSON state: {str(e)}")
 
-def load_used_content(filename='used_content.json'):
-    """Load previously used content."""
-    try:
-        with open(filename, 'r') as f:
-            content = json.load(f)
-        return set(content.get('posts', [])), set(content.get('topics', []))
-    except FileNotFoundError:
-        return set(), set()
-    except Exception as e:
-        print(f"Error loading used content: {str(e)}")
-        return set(), set()
+# Validation for meme replies: technical substance and a recognisable meme format
+MEME_TECHNICAL_TERMS = re.compile(
+    r"model|training|neural|layer|data|accuracy|loss|gpu|inference|parameters|batch|epoch|"
+    r"gradient|optimizer|transformer|attention|fine-tune|dataset|validation",
+    re.IGNORECASE
+)
+MEME_FORMATS = re.compile(r"when you realize|that moment when|me when|nobody:|everyone:", re.IGNORECASE)
+
+def pick_meme_candidate(candidates):
+    """Pick the best meme reply from several completions.
+    Candidates with a meme format and technical terms pass; among them the one
+    using the most distinct technical terms wins, preferring ones that fit in
+    240 characters. Returns (response, passed); when none pass, the best
+    candidate with a meme format is returned (or None) with passed=False."""
+    best, best_score = None, None
+    for candidate in candidates:
+        has_meme_format = MEME_FORMATS.search(candidate) is not None
+        technical_terms = {term.lower() for term in MEME_TECHNICAL_TERMS.findall(candidate)}
+        if not has_meme_format:
+            continue
+        score = (bool(technical_terms), len(candidate) <= 240, len(technical_terms))
+        if best_score is None or score > best_score:
+            best, best_score = candidate, score
+    
+    if best is not None and len(best) > 240:
+        best = best[:237] + "..."
+    return best, bool(best_score and best_score[0])
 
 def generate_meme_response(post_content, thread_context, client):
-    """Generate witty text-meme responses that are contextually relevant and professional."""
+    """Generate witty text-meme responses that are contextually relevant and professional.
+    Asks for several candidates per call and makes at most MEME_MAX_ATTEMPTS calls."""
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": """You are a witty AI expert who creates clever, contextual responses 
+        # Readable thread context within the token budget instead of the raw list
+        context_posts, _ = budget_thread_context(thread_context, query=post_content, budget=MEME_CONTEXT_TOKEN_BUDGET)
+        thread_conversation = "\n\n".join(format_thread_post(post) for post in context_posts)
+        
+        messages = [
+            {"role": "system", "content": """You are a witty AI expert who creates clever, contextual responses 
                 to AI discussions. Your responses should demonstrate deep understanding of AI/ML while being 
                 entertaining and professional.
 
@@ -1447,9 +1691,10 @@ def generate_meme_response(post_content, thread_context, client):
                 - Play on common ML debugging scenarios
                 - Reference current AI trends/tools
                 - Use popular meme formats with AI twists"""},
-                {"role": "user", "content": f"""Create a witty, technically-accurate response to this AI discussion:
+            {"role": "user", "content": f"""Create a witty, technically-accurate response to this AI discussion:
                 
-                Full Thread Context: {thread_context}
+                Full Thread Context:
+                {thread_conversation}
                 Latest Post: {post_content}
                 
                 Requirements:
@@ -1464,38 +1709,30 @@ def generate_meme_response(post_content, thread_context, client):
                   * "Me when..."
                   * "Everyone: ..."
                 """}
-            ],
-            max_tokens=100,
-            temperature=0.85  # Balanced between creativity and coherence
-        )
-        
-        ai_response = response.choices[0].message.content.strip()
-        
-        # Clean up and validate response
-        if len(ai_response) > 240:
-            ai_response = ai_response[:237] + "..."
-            
-        # Ensure response has technical merit
-        technical_terms = ['model', 'training', 'neural', 'layer', 'data', 
-                         'accuracy', 'loss', 'GPU', 'inference', 'parameters',
-                         'batch', 'epoch', 'gradient', 'optimizer', 'transformer',
-                         'attention', 'fine-tune', 'dataset', 'validation']
-        has_technical_content = any(term in ai_response.lower() for term in technical_terms)
-        
-        # Ensure response uses a meme format
-        meme_patterns = [
-            "when you realize",
-            "that moment when",
-            "me when",
-            "nobody:",
-            "everyone:"
         ]
-        has_meme_format = any(pattern in ai_response.lower() for pattern in meme_patterns)
         
-        if not has_technical_content or not has_meme_format:
-            # Try again if response lacks either technical substance or meme format
-            return generate_meme_response(post_content, thread_context, client)
+        # Several candidates per call; a bounded number of calls instead of regenerating until one passes
+        candidates = []
+        ai_response = None
+        for attempt in range(1, MEME_MAX_ATTEMPTS + 1):
+            response = client.chat.completions.create(
+                model="gpt-4",
+                messages=messages,
+                max_tokens=100,
+                temperature=0.85,  # Balanced between creativity and coherence
+                n=MEME_CANDIDATES
+            )
+            candidates.extend(choice.message.content.strip() for choice in response.choices
+                              if choice.message.content)
             
+            # Best candidate across every attempt so far
+            ai_response, passed = pick_meme_candidate(candidates)
+            if passed:
+                return ai_response
+            print(f"No meme candidate passed validation (attempt {attempt}/{MEME_MAX_ATTEMPTS})")
+        
+        if ai_response:
+            print("Using the best partial meme candidate")
         return ai_response
         
     except Exception as e:
@@ -1519,11 +1756,9 @@ def find_popular_ai_discussions(token, client_atproto, used_meme_responses, min_
         ]
         
         for keyword in ai_keywords:
-            url = "https://bsky.social/xrpc/app.bsky.feed.searchPosts"
-            headers = {"Authorization": f"Bearer {token}"}
             params = {"q": keyword, "limit": 20}
             
-            response = requests.get(url, headers=headers, params=params)
+            response = xrpc.get("app.bsky.feed.searchPosts", params=params, token=token)
             if response.status_code == 200:
                 posts = response.json().get('posts', [])
                 
@@ -1556,8 +1791,6 @@ def find_popular_ai_discussions(token, client_atproto, used_meme_responses, min_
                         
                         if not any(p['uri'] == post_details['uri'] for p in popular_posts):
                             popular_posts.append(post_details)
-            
-            time.sleep(1)  # Rate limiting
         
         sorted_posts = sorted(popular_posts, key=lambda x: x['engagement'], reverse=True)
         print(f"Found {len(sorted_posts)} popular English AI discussions")
@@ -1575,23 +1808,3 @@ def find_popular_ai_discussions(token, client_atproto, used_meme_responses, min_
     except Exception as e:
         print(f"Error finding popular discussions: {str(e)}")
         return []
-
-def save_used_meme_responses(used_meme_responses, filename='used_meme_responses.json'):
-    """Save URIs of posts we've already responded to with memes."""
-    try:
-        with open(filename, 'w') as f:
-            json.dump(list(used_meme_responses), f)
-        print(f"Saved {len(used_meme_responses)} used meme responses")
-    except Exception as e:
-        print(f"Error saving used meme responses: {str(e)}")
-
-def load_used_meme_responses(filename='used_meme_responses.json'):
-    """Load previously used meme response URIs."""
-    try:
-        with open(filename, 'r') as f:
-            return set(json.load(f))
-    except FileNotFoundError:
-        return set()
-    except Exception as e:
-        print(f"Error loading used meme responses: {str(e)}")
-        return set()
\ No newline at end of file
@@ -0,0 +1,93 @@
+import threading
+from openai.types.chat import ChatCompletion
+from config import LLM_CACHE_MODE, LLM_CACHE_FILE, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES
+from cache import CompletionCache
+
+# Request arguments that don't change the completion and are left out of the cache key
+UNKEYED_ARGS = ('timeout', 'extra_headers', 'extra_query', 'extra_body', 'user')
+
+
+class CachedCompletions:
+    """Drop-in for `client.chat.completions` that serves completions from a CompletionCache.
+
+    Modes:
+      off    - every request goes to the API
+      cache  - deterministic requests (temperature 0) are served from and saved to the cache
+      record - every request goes to the API and its completion is saved
+      replay - every request is served from the cache; a miss raises LookupError"""
+
+    def __init__(self, completions, cache, mode):
+        self._completions = completions
+        self.cache = cache
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._completions, name)
+
+    def _cacheable(self, kwargs):
+        if kwargs.get('stream'):
+            return False
+        if self.mode in ('record', 'replay'):
+            return True
+        return self.mode == 'cache' and kwargs.get('temperature', 1) == 0
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def create(self, **kwargs):
+        if not self._cacheable(kwargs):
+            return self._completions.create(**kwargs)
+        
+        key = self.cache.make_key({k: v for k, v in kwargs.items() if k not in UNKEYED_ARGS})
+        if self.mode != 'record':
+            cached = self.cache.get(key, ignore_ttl=self.mode == 'replay')
+            if cached is not None:
+                self._count(True)
+                return ChatCompletion.model_validate_json(cached)
+            if self.mode == 'replay':
+                raise LookupError(f"No recorded completion for {kwargs.get('model')} request {key[:12]}")
+        
+        self._count(False)
+        response = self._completions.create(**kwargs)
+        try:
+            self.cache.put(key, response.model_dump_json())
+        except Exception as e:
+            print(f"Error caching completion: {str(e)}")
+        return response
+
+
+class CachedChat:
+    """Drop-in for `client.chat` whose completions go through the cache."""
+
+    def __init__(self, chat, completions):
+        self._chat = chat
+        self.completions = completions
+
+    def __getattr__(self, name):
+        return getattr(self._chat, name)
+
+
+class CachedOpenAI:
+    """Wraps an OpenAI client so chat completions are cached; everything else passes through."""
+
+    def __init__(self, client, mode=LLM_CACHE_MODE, cache=None):
+        if mode not in ('off', 'cache', 'record', 'replay'):
+            raise ValueError(f"Unknown LLM cache mode: {mode}")
+        self._client = client
+        self.mode = mode
+        self.cache = None
+        if mode == 'off':
+            return  # client.chat passes through untouched
+        self.cache = cache or CompletionCache(LLM_CACHE_FILE, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_MAX_ENTRIES)
+        self.chat = CachedChat(client.chat, CachedCompletions(client.chat.completions, self.cache, mode))
+        print(f"LLM completion cache: {mode} mode ({self.cache.path})")
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
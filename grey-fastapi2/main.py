@@ -1,5 +1,4 @@
 import os
-from datetime import datetime, timedelta
 import time
 from dotenv import load_dotenv
 from openai import OpenAI
@@ -7,21 +6,25 @@ from atproto import Client
 from memory import BotMemory
 import pytz
 import random
+import threading
+from scheduler import JobRunner
+from state import PersistentSet, RotatingDedup
+
+from session import SessionManager
+from xrpc import xrpc
+from llm_cache import CachedOpenAI
 
 from functions import (
-    get_auth_token, 
     get_bot_did, 
     post_reply,
     post_trending_content, 
     check_notifications,
     post_ai_news,
-    save_used_content,
-    load_used_content,
     generate_meme_response,
     find_popular_ai_discussions,
     get_full_thread_context,
-    save_used_meme_responses,
-    load_used_meme_responses
+    state_store,
+    migrate_json_state
 )
 
 from config import (MEMORY_UPDATE_TIME, 
@@ -30,7 +33,11 @@ from config import (MEMORY_UPDATE_TIME,
                     THREAD_POST_INTERVAL,
                     CHECK_INTERVAL,
                     NEWS_POST_INTERVAL,
-                    MEME_ENGAGEMENT_INTERVAL    
+                    MEME_ENGAGEMENT_INTERVAL,
+                    MEMORY_CHECK_INTERVAL,
+                    USED_POSTS_TTL,
+                    USED_TOPICS_TTL,
+                    USED_MEME_RESPONSES_TTL
                     )
 
 
@@ -40,23 +47,17 @@ def main():
     
     # Initialize OpenAI client with API key
     client_openai = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+    # Chat completions go through the on-disk completion cache (LLM_CACHE_MODE)
+    client_openai = CachedOpenAI(client_openai)
     client_atproto = Client()
     
-    # Initialize variables for authentication tokens and bot DID
-    access_token = None
-    refresh_token = None
-    token_creation_time = None
-    token_expiry = timedelta(hours=1)
-    bot_did = None
-    
-    # Sets to track used content and topics to ensure variety
-    used_posts = set()
-    used_topics = set()
+    # Session manager keeps the access token fresh for every job and XRPC call
+    session_manager = SessionManager()
+    xrpc.session_manager = session_manager
     
-    last_post_time = None 
-    last_memory_update = None
-    last_news_post_time = None
-    last_meme_engagement = None
+    # Bot DID, shared by all jobs
+    auth_lock = threading.Lock()
+    auth = {'bot_did': None}
     
     # Initialize memory system ONCE
     print("Initializing bot memory...")
@@ -65,163 +66,163 @@ def main():
     # Get the correct bot handle from environment variables
     BOT_HANDLE = os.getenv('BSKY_IDENTIFIER')  
     
-    # Load previously used content
-    used_posts, used_topics = load_used_content()
-    used_meme_responses = load_used_meme_responses()
+    # Previously used content lives in the state store (shared between job threads)
+    migrate_json_state(state_store)
+    used_posts = RotatingDedup(state_store, 'post', ttl=USED_POSTS_TTL)  # Hashed keys, expires a day at a time
+    used_topics = PersistentSet(state_store, 'topic', ttl=USED_TOPICS_TTL)
+    used_meme_responses = PersistentSet(state_store, 'meme_response', ttl=USED_MEME_RESPONSES_TTL)
     
-    while True:
-        try:
-            current_time = datetime.now()
-            ist_time = current_time.astimezone(MEMORY_UPDATE_TIMEZONE)
-            print(f"\n[{ist_time}] Starting new check...")
-
-            # Check for memory update time first
-            if bot_memory.is_memory_update_time():
-                print(f"\n🚨 MEMORY UPDATE TIME - {MEMORY_UPDATE_TIME.hour:02d}:{MEMORY_UPDATE_TIME.minute:02d} {MEMORY_UPDATE_TIMEZONE.zone}")
-                print("=======================================")
-                print("FORCING ALL OPERATIONS TO STOP")
-                print("=======================================")
-                
-                # Set force stop flag
-                bot_memory.force_stop_needed = True
-                
-                # Wait for any ongoing operations to complete their force stop
-                time.sleep(5)
-                
-                # Perform memory update
-                if not bot_memory.is_memory_updating():
-                    print("\nStarting memory update process...")
-                    success = bot_memory.update_memory(
-                        client_atproto, 
-                        BOT_HANDLE
-                    )
-                    if success:
-                        print("\n Memory update complete")
-                        bot_memory.clear_force_stop()
-                        last_memory_update = current_time
-                    else:
-                        print("\n❌ Memory update failed")
-                    
-                    # Wait before resuming operations
-                    time.sleep(60)
-                    continue
-            
-            # Regular operations
-            if not bot_memory.should_force_stop():
-                # Refresh authentication tokens if needed
-                if (access_token is None or 
-                    token_creation_time is None or 
-                    current_time - token_creation_time >= token_expiry):
-                    
-                    print("Getting new authentication tokens...")
-                    access_token, refresh_token = get_auth_token()
-                    token_creation_time = current_time
-                    
-                    if not access_token:
-                        print("Failed to get authentication tokens. Waiting...")
-                        time.sleep(CHECK_INTERVAL)
-                        continue
+    def ensure_auth():
+        """Return a valid access token and the bot DID."""
+        access_token = session_manager.get_access_token()
+        if not access_token:
+            print("Failed to get authentication tokens. Waiting...")
+            return None, None
+        
+        with auth_lock:
+            if auth['bot_did'] is None:
+                auth['bot_did'] = get_bot_did(access_token, BOT_HANDLE)
+                if not auth['bot_did']:
+                    print("Failed to get bot DID. Waiting...")
+                    return None, None
+        
+        return access_token, auth['bot_did']
+    
+    def memory_update_job():
+        """Run daily memory maintenance: evict old memories and, only when due, a full
+        rebuild. Rebuilds fill a fresh namespace, so other jobs keep running meanwhile."""
+        if not bot_memory.is_memory_update_time():
+            return True
+        
+        print(f"\n🧠 MEMORY MAINTENANCE - {MEMORY_UPDATE_TIME.hour:02d}:{MEMORY_UPDATE_TIME.minute:02d} {MEMORY_UPDATE_TIMEZONE.zone}")
+        bot_memory.evict_old_records()
+        bot_memory.rebuild_needed = bot_memory.needs_rebuild()
+        
+        if not bot_memory.rebuild_needed:
+            print("\nMemory is kept up to date as posts are published, no rebuild needed")
+        elif not bot_memory.is_memory_updating():
+            print("\nStarting memory rebuild...")
+            success = bot_memory.update_memory(
+                client_atproto, 
+                BOT_HANDLE
+            )
+            if success:
+                print("\n Memory update complete")
+            else:
+                print("\n❌ Memory update failed, still serving the previous memory")
+        
+        # Wait until the update minute has passed
+        time.sleep(60)
+        return True
+    
+    def notifications_job():
+        """Reply to mentions and replies."""
+        access_token, bot_did = ensure_auth()
+        if not access_token:
+            return False
+        check_notifications(access_token, client_openai, client_atproto, bot_memory)
+        return True
+    
+    def news_job():
+        """Post a thread about recent AI news."""
+        access_token, bot_did = ensure_auth()
+        if not access_token:
+            return False
+        
+        print("\nChecking for AI news...")
+        return post_ai_news(
+            access_token,
+            bot_did,
+            used_posts,
+            client_openai,
+            bot_memory
+        )
+    
+    def trending_job():
+        """Post a new thread about trending AI content."""
+        access_token, bot_did = ensure_auth()
+        if not access_token:
+            return False
+        
+        print("\nPosting new trending thread...")
+        success = post_trending_content(
+                access_token, 
+                bot_did, 
+                used_posts, 
+                used_topics, 
+                client_openai, 
+                keywords,
+                bot_memory
+            )
+        print(f"Thread posting result: {success}")
+        return success
+    
+    def meme_job():
+        """Engage with popular AI discussions using meme replies."""
+        access_token, bot_did = ensure_auth()
+        if not access_token:
+            return False
+        
+        print("\nLooking for popular AI discussions to engage with...")
+        popular_posts = find_popular_ai_discussions(access_token, client_atproto, used_meme_responses)
+        
+        engagement_count = 0
+        for post in popular_posts[:5]:
+            if post['uri'] not in used_meme_responses:  # Double check
+                try:
+                    # Get thread context
+                    thread_context = get_full_thread_context(access_token, post['uri'], client_atproto)
                     
-                    bot_did = get_bot_did(access_token, os.getenv('BSKY_IDENTIFIER'))
-                    if not bot_did:
-                        print("Failed to get bot DID. Waiting...")
-                        time.sleep(CHECK_INTERVAL)
-                        continue
-                
-                # Regular operations
-                check_notifications(access_token, client_openai, client_atproto, bot_memory)
-                
-                # Check for news posts
-                if last_news_post_time is None or (current_time - last_news_post_time).total_seconds() >= NEWS_POST_INTERVAL:
-                    print("\nChecking for AI news...")
-                    success = post_ai_news(
-                        access_token,
-                        bot_did,
-                        used_posts,
-                        client_openai,
-                        bot_memory
+                    # Generate meme response
+                    meme_response = generate_meme_response(
+                        post['text'],
+                        thread_context,
+                        client_openai
                     )
-                    if success:
-                        last_news_post_time = current_time
-                        # Save used content after successful post
-                        save_used_content(used_posts, used_topics)
-                
-                if last_post_time is None or (current_time - last_post_time).total_seconds() >= THREAD_POST_INTERVAL:
-                    print("\nPosting new trending thread...")
-                    success = post_trending_content(
-                            access_token, 
-                            bot_did, 
-                            used_posts, 
-                            used_topics, 
-                            client_openai, 
-                            keywords,
-                            bot_memory  # Pass bot_memory to check for update time
-                        )
-                    if success:
-                        last_post_time = current_time
-                        print(f"Thread posting result: {success}")
-                
-                # Check for meme engagement opportunities
-                if last_meme_engagement is None or (current_time - last_meme_engagement).total_seconds() >= MEME_ENGAGEMENT_INTERVAL:
-                    print("\nLooking for popular AI discussions to engage with...")
-                    popular_posts = find_popular_ai_discussions(access_token, client_atproto, used_meme_responses)
                     
-                    engagement_count = 0
-                    for post in popular_posts[:5]:
-                        if post['uri'] not in used_meme_responses:  # Double check
-                            try:
-                                # Get thread context
-                                thread_context = get_full_thread_context(access_token, post['uri'], client_atproto)
-                                
-                                # Generate meme response
-                                meme_response = generate_meme_response(
-                                    post['text'],
-                                    thread_context,
-                                    client_openai
-                                )
-                                
-                                if meme_response:
-                                    success = post_reply(
-                                        token=access_token,
-                                        author_handle=post['author'],
-                                        post_content=post['text'],
-                                        post_uri=post['uri'],
-                                        bot_did=bot_did,
-                                        client=client_openai,
-                                        ai_response=meme_response,
-                                        bot_memory=bot_memory,
-                                        is_meme=True
-                                    )
-                                    
-                                    if success:
-                                        used_meme_responses.add(post['uri'])
-                                        save_used_meme_responses(used_meme_responses)  # Save after each successful response
-                                        engagement_count += 1
-                                        print(f"Successfully engaged with @{post['author']}'s post ({engagement_count}/3)")
-                                        
-                                        # Break if we've engaged with 3 posts
-                                        if engagement_count >= 3:
-                                            break
-                                            
-                                        # Wait 30-60 seconds between successful engagements
-                                        time.sleep(random.uniform(30, 60))
+                    if meme_response:
+                        success = post_reply(
+                            token=access_token,
+                            author_handle=post['author'],
+                            post_content=post['text'],
+                            post_uri=post['uri'],
+                            bot_did=bot_did,
+                            client=client_openai,
+                            ai_response=meme_response,
+                            bot_memory=bot_memory,
+                            is_meme=True
+                        )
+                        
+                        if success:
+                            used_meme_responses.add(post['uri'])  # Persisted immediately
+                            engagement_count += 1
+                            print(f"Successfully engaged with @{post['author']}'s post ({engagement_count}/3)")
+                            
+                            # Break if we've engaged with 3 posts
+                            if engagement_count >= 3:
+                                break
                                 
-                            except Exception as e:
-                                print(f"Error engaging with post: {str(e)}")
-                                time.sleep(15)  # Short delay on error
-                                continue
+                            # Wait 30-60 seconds between successful engagements
+                            time.sleep(random.uniform(30, 60))
                     
-                    last_meme_engagement = current_time
-            
-            # Wait before next check
-            print(f"\nWaiting {CHECK_INTERVAL} seconds before next check...")
-            time.sleep(CHECK_INTERVAL)
-            
-        except Exception as e:
-            print(f"Error in main loop: {str(e)}")
-            print(f"Waiting {CHECK_INTERVAL} seconds before retry...")
-            time.sleep(CHECK_INTERVAL)
+                except Exception as e:
+                    print(f"Error engaging with post: {str(e)}")
+                    time.sleep(15)  # Short delay on error
+                    continue
+        
+        return True
+    
+    # Each job runs in its own worker so notifications never wait behind content jobs
+    runner = JobRunner()
+    runner.add_job("memory-update", memory_update_job, MEMORY_CHECK_INTERVAL)
+    runner.add_job("notifications", notifications_job, CHECK_INTERVAL)
+    runner.add_job("ai-news", news_job, NEWS_POST_INTERVAL, retry_interval=CHECK_INTERVAL)
+    # Back off after failed runs so a repeated topic doesn't cost a full thread generation every minute
+    runner.add_job("trending-thread", trending_job, THREAD_POST_INTERVAL, retry_interval=CHECK_INTERVAL,
+                   max_retry_interval=THREAD_POST_INTERVAL)
+    runner.add_job("meme-engagement", meme_job, MEME_ENGAGEMENT_INTERVAL, retry_interval=CHECK_INTERVAL)
+    runner.run_forever()
 
 if __name__ == "__main__":
     print("Starting trending bot...")
-    main() 
\ No newline at end of file
+    main() 
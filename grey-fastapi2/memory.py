@@ -1,11 +1,38 @@
 import os
-from datetime import datetime
+import json
+import queue
+import threading
+from datetime import datetime, timedelta
 import time
-from openai import OpenAI
-from pinecone import Pinecone
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from openai import OpenAI, BadRequestError, UnprocessableEntityError
 from atproto import Client
 import pytz
-from config import MEMORY_UPDATE_TIME, MEMORY_UPDATE_TIMEZONE
+from config import (MEMORY_UPDATE_TIME,
+                    MEMORY_UPDATE_TIMEZONE,
+                    EMBEDDING_MODEL,
+                    EMBEDDING_MAX_BATCH_SIZE,
+                    EMBEDDING_MAX_BATCH_TOKENS,
+                    EMBEDDING_MAX_RETRIES,
+                    MEMORY_RETENTION_DAYS,
+                    MEMORY_REBUILD_INTERVAL_DAYS,
+                    MEMORY_STATE_FILE,
+                    EMBEDDING_CACHE_FILE,
+                    EMBEDDING_CACHE_MAX_ENTRIES,
+                    QUERY_CACHE_SIZE,
+                    QUERY_CACHE_TTL,
+                    MEMORY_REBUILD_MIN_RATIO,
+                    MEMORY_PIPELINE_QUEUE_SIZE,
+                    MEMORY_UPSERT_BATCH_SIZE,
+                    MEMORY_UPSERT_CONCURRENCY,
+                    MEMORY_UPSERT_RETRIES,
+                    MEMORY_COUNT_CONFIRM_TIMEOUT)
+from xrpc import xrpc
+from cache import EmbeddingCache, TTLCache
+from vector_store import create_vector_store
+
+# Marks the end of a memory pipeline queue
+_PIPELINE_DONE = object()
 
 class BotMemory:
     def __init__(self, client):
@@ -13,151 +40,237 @@ class BotMemory:
         print("Initializing BotMemory...")
         self.client = client
         self.openai_client = OpenAI()
-        self.index = self.initialize_pinecone()
+        self.embedding_cache = EmbeddingCache(EMBEDDING_CACHE_FILE, max_entries=EMBEDDING_CACHE_MAX_ENTRIES)
+        self.store = self.initialize_vector_store()
+        # Query-side caches; results are keyed by the store version so any index change invalidates them
+        self.query_embedding_cache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+        self.query_result_cache = TTLCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
         self.is_updating = False  # Flag to track update status
+        # Double-buffered namespaces: readers use the active one, rebuilds fill a new one
+        self.namespace_lock = threading.Lock()
+        self.active_namespace = ""
+        self.previous_namespace = None  # Deleted at the next swap, after in-flight reads and writes are done
+        self.building_namespace = None  # Namespace being filled by a running rebuild
         self.last_update_time = None
+        self.load_memory_state()
         self.force_update_needed = False  # Add this new flag
         self.is_update_time = False  # New flag for update time
-        self.force_stop_needed = False  # New flag for immediate stops
+        self.rebuild_needed = self.needs_rebuild()  # Whether the next update window runs a full rebuild
+        # Background writer so indexing new posts never delays posting
+        self.write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-writer")
     
-    def initialize_pinecone(self):
-        """Initialize Pinecone connection."""
+    def initialize_vector_store(self):
+        """Initialize the configured vector store (Pinecone or local)."""
         try:
-            print("\nConnecting to Pinecone...")
-            pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
-            
-            index_name = "greybot-memory"
-            if index_name not in pc.list_indexes().names():
-                print(f"Creating new index: {index_name}")
-                pc.create_index(
-                    name=index_name,
-                    dimension=1536,
-                    metric='cosine'
-                )
-            
-            return pc.Index(index_name)
-            
+            return create_vector_store()
         except Exception as e:
-            print(f"ERROR initializing Pinecone: {str(e)}")
+            print(f"ERROR initializing vector store: {str(e)}")
             raise e
 
-    def get_last_post(self, client_atproto: Client, bot_handle: str):
-        """Get the last 1000 posts made by the bot."""
-        try:
-            print(f"\nFetching last 1000 posts for {bot_handle}...")
-            profile = client_atproto.get_profile(bot_handle)
-            
-            # Initialize variables for pagination
-            all_threads = []
-            cursor = None
-            posts_collected = 0
-            MAX_POSTS = 1000
-            POSTS_PER_PAGE = 100  # Maximum allowed by the API
+    def iter_last_posts(self, client_atproto: Client, bot_handle: str, max_posts=1000):
+        """Yield the bot's latest posts one feed page at a time, up to max_posts.
+        Posts made within a minute of each other are grouped into a thread and
+        yielded oldest first; a thread still open at the end of a page is
+        carried over to the next page."""
+        print(f"\nStreaming last {max_posts} posts for {bot_handle}...")
+        profile = client_atproto.get_profile(bot_handle)
+        
+        cursor = None
+        posts_collected = 0
+        POSTS_PER_PAGE = 100  # Maximum allowed by the API
+        current_thread = []
+        current_thread_time = None
+        
+        while posts_collected < max_posts:
+            feed = client_atproto.get_author_feed(
+                profile.did,
+                limit=POSTS_PER_PAGE,
+                cursor=cursor
+            )
+            if not feed.feed:
+                break
             
-            while posts_collected < MAX_POSTS:
-                # Get feed with pagination
-                feed = client_atproto.get_author_feed(
-                    profile.did, 
-                    limit=POSTS_PER_PAGE,
-                    cursor=cursor
-                )
-                
-                if not feed.feed:
-                    break
-                    
-                current_thread = None
-                current_thread_time = None
-                
-                for post in feed.feed:
-                    post_time = datetime.fromisoformat(post.post.record.created_at.replace('Z', '+00:00'))
-                    
-                    if current_thread is None:
-                        # Start a new thread
-                        current_thread = [{
-                            'uri': post.post.uri,
-                            'cid': post.post.cid,
-                            'text': post.post.record.text,
-                            'created_at': post.post.record.created_at,
-                            'position': 'main'
-                        }]
-                        current_thread_time = post_time
-                    else:
-                        # Check if this post belongs to current thread (within 1 minute)
-                        time_diff = abs((post_time - current_thread_time).total_seconds())
-                        
-                        if time_diff <= 60:  # Within 1 minute window
-                            print(f"\nFound related post (time diff: {time_diff:.1f}s):")
-                            print(f"Text: {post.post.record.text[:100]}...")
-                            current_thread.append({
-                                'uri': post.post.uri,
-                                'cid': post.post.cid,
-                                'text': post.post.record.text,
-                                'created_at': post.post.record.created_at,
-                                'position': 'thread'
-                            })
-                        else:
-                            # Store current thread and start a new one
-                            if current_thread:
-                                all_threads.append(current_thread)
-                                posts_collected += len(current_thread)
-                                
-                                if posts_collected >= MAX_POSTS:
-                                    break
-                                    
-                            current_thread = [{
-                                'uri': post.post.uri,
-                                'cid': post.post.cid,
-                                'text': post.post.record.text,
-                                'created_at': post.post.record.created_at,
-                                'position': 'main'
-                            }]
-                            current_thread_time = post_time
-                
-                # Add the last thread from this page
-                if current_thread and posts_collected < MAX_POSTS:
-                    all_threads.append(current_thread)
-                    posts_collected += len(current_thread)
-                
-                # Update cursor for next page
-                if hasattr(feed, 'cursor') and feed.cursor:
-                    cursor = feed.cursor
+            page_posts = []
+            for item in feed.feed:
+                post_time = datetime.fromisoformat(item.post.record.created_at.replace('Z', '+00:00'))
+                post = {
+                    'uri': item.post.uri,
+                    'cid': item.post.cid,
+                    'text': item.post.record.text,
+                    'created_at': item.post.record.created_at,
+                    'position': 'thread'
+                }
+                # Posts within 1 minute of the thread's first post belong to it
+                if current_thread and abs((post_time - current_thread_time).total_seconds()) <= 60:
+                    current_thread.append(post)
                 else:
-                    break
-                    
-                print(f"Collected {posts_collected} posts so far...")
-                time.sleep(1)  # Rate limiting
-            
-            # Flatten the threads into a single list
-            all_posts = []
-            for thread in all_threads:
-                thread.sort(key=lambda x: x['created_at'])
-                all_posts.extend(thread)
-            
-            # Trim to exactly 1000 if we got more
-            all_posts = all_posts[:MAX_POSTS]
-            
-            print(f"\nTotal threads found: {len(all_threads)}")
-            print(f"Total posts collected: {len(all_posts)}")
-            
-            # Log sample of posts (first 5 and last 5)
-            print("\nSample of first 5 posts:")
-            for idx, post in enumerate(all_posts[:5], 1):
-                print(f"\n{idx}. {post['position'].upper()}:")
-                print(f"Text: {post['text'][:100]}...")
+                    page_posts.extend(sorted(current_thread, key=lambda x: x['created_at']))
+                    post['position'] = 'main'
+                    current_thread = [post]
+                    current_thread_time = post_time
             
-            print("\nSample of last 5 posts:")
-            for idx, post in enumerate(all_posts[-5:], len(all_posts)-4):
-                print(f"\n{idx}. {post['position'].upper()}:")
-                print(f"Text: {post['text'][:100]}...")
+            page_posts = page_posts[:max_posts - posts_collected]
+            if page_posts:
+                posts_collected += len(page_posts)
+                print(f"Fetched {posts_collected} posts so far...")
+                yield page_posts
             
-            return all_posts
+            if not getattr(feed, 'cursor', None):
+                break
+            cursor = feed.cursor
+            xrpc.rate_limiter.acquire(xrpc.host)  # Pace pages with the shared adaptive limiter
+        
+        last_posts = sorted(current_thread, key=lambda x: x['created_at'])[:max_posts - posts_collected]
+        if last_posts:
+            yield last_posts
+
+    @staticmethod
+    def estimate_tokens(text):
+        """Rough token count used to size embedding batches (about 3 characters per token)."""
+        return len(text) // 3 + 1
+
+    def _split_embedding_batches(self, indexed_texts):
+        """Split (index, text) pairs into sub-batches within the request size and token limits."""
+        batches = []
+        current = []
+        current_tokens = 0
+        for item in indexed_texts:
+            tokens = self.estimate_tokens(item[1])
+            if current and (len(current) >= EMBEDDING_MAX_BATCH_SIZE or
+                            current_tokens + tokens > EMBEDDING_MAX_BATCH_TOKENS):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(item)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_batch(self, batch, embeddings):
+        """Embed one sub-batch. Requests the API rejects as invalid are split in half
+        to isolate the bad items; other failures (timeouts, outages, rate limits) are
+        retried and then give up on the whole batch."""
+        for attempt in range(EMBEDDING_MAX_RETRIES):
+            try:
+                response = self.openai_client.embeddings.create(
+                    input=[text for _, text in batch],
+                    model=EMBEDDING_MODEL
+                )
+                for item in response.data:
+                    embeddings[batch[item.index][0]] = item.embedding
+                return
+            except (BadRequestError, UnprocessableEntityError) as e:
+                print(f"Embedding request for {len(batch)} texts rejected: {str(e)}")
+                break
+            except Exception as e:
+                print(f"Embedding request for {len(batch)} texts failed (attempt {attempt + 1}): {str(e)}")
+                if attempt < EMBEDDING_MAX_RETRIES - 1:
+                    time.sleep(2 ** attempt)
+                else:
+                    print(f"Giving up on embedding {len(batch)} texts")
+                    return
+
+        if len(batch) > 1:
+            # Retry each half on its own so only the invalid items are lost
+            middle = len(batch) // 2
+            self._embed_batch(batch[:middle], embeddings)
+            self._embed_batch(batch[middle:], embeddings)
+        else:
+            print(f"Giving up on embedding text: {batch[0][1][:100]}...")
+
+    def embed_texts(self, texts):
+        """Embed a list of texts with as few API requests as possible.
+        Cached embeddings are reused; only texts not seen before are sent to the API.
+        Returns a list aligned with texts; failed or empty texts get None."""
+        embeddings = [None] * len(texts)
+        cached = self.embedding_cache.get_many(EMBEDDING_MODEL, [text for text in texts if text])
+        
+        indexed_texts = []
+        for i, text in enumerate(texts):
+            if text in cached:
+                embeddings[i] = cached[text]
+            elif text and text.strip():
+                indexed_texts.append((i, text))
+        
+        if cached:
+            print(f"Embedding cache: {len(texts) - len(indexed_texts)} hits, {len(indexed_texts)} misses")
+        
+        for batch in self._split_embedding_batches(indexed_texts):
+            self._embed_batch(batch, embeddings)
+        
+        self.embedding_cache.put_many(
+            EMBEDDING_MODEL,
+            [(text, embeddings[i]) for i, text in indexed_texts if embeddings[i] is not None]
+        )
+        return embeddings
+
+    def _build_vectors(self, posts, embeddings):
+        """Turn posts and their embeddings into vector store records, skipping posts without one."""
+        vectors = []
+        for post, embedding in zip(posts, embeddings):
+            try:
+                if embedding is None:
+                    print(f"Skipping post without embedding: {post['uri']}")
+                    continue
                 
-        except Exception as e:
-            print(f"Error getting latest posts: {str(e)}")
-            return None
+                vectors.append({
+                    'id': post['uri'],
+                    'values': embedding,
+                    'metadata': {
+                        'uri': post['uri'],
+                        'cid': post['cid'],
+                        'text': post['text'],
+                        'created_at': post['created_at'],
+                        'created_ts': self.to_timestamp(post['created_at']),
+                        'position': post['position']
+                    }
+                })
+            except Exception as e:
+                print(f"Failed to process post: {str(e)}")
+        return vectors
+
+    def _upsert_batch(self, batch, namespace):
+        """Upsert one batch, backing off and retrying only when the request fails."""
+        for attempt in range(MEMORY_UPSERT_RETRIES):
+            try:
+                self.store.upsert(batch, namespace=namespace)
+                return True
+            except Exception as e:
+                print(f"Error upserting {len(batch)} vectors (attempt {attempt + 1}): {str(e)}")
+                if attempt < MEMORY_UPSERT_RETRIES - 1:
+                    time.sleep(2 ** attempt)
+        return False
+
+    def _upsert_vectors(self, vectors, namespace):
+        """Upsert vectors in batches, MEMORY_UPSERT_CONCURRENCY at a time.
+        Returns False if a batch could not be stored."""
+        batches = [vectors[i:i + MEMORY_UPSERT_BATCH_SIZE]
+                   for i in range(0, len(vectors), MEMORY_UPSERT_BATCH_SIZE)]
+        if not batches:
+            return True
+        with ThreadPoolExecutor(max_workers=min(MEMORY_UPSERT_CONCURRENCY, len(batches)),
+                                thread_name_prefix="memory-upsert") as executor:
+            results = list(executor.map(lambda batch: self._upsert_batch(batch, namespace), batches))
+        print(f"✓ Stored {sum(len(b) for b, ok in zip(batches, results) if ok)}/{len(vectors)} vectors")
+        return all(results)
 
-    def store_thread_posts(self, posts):
-        """Store posts in Pinecone with retries."""
+    def wait_for_count(self, namespace, expected, timeout=MEMORY_COUNT_CONFIRM_TIMEOUT):
+        """Poll the namespace's vector count until it reaches expected or timeout passes.
+        Index stats can lag behind upserts, so this is checked once after a rebuild
+        instead of sleeping after every batch. Returns the last count seen."""
+        deadline = time.time() + timeout
+        while True:
+            count = self.store.count(namespace=namespace)
+            if count >= expected or time.time() >= deadline:
+                return count
+            time.sleep(0.5)
+
+    def store_thread_posts(self, posts, namespace=None):
+        """Store posts in the vector store with retries.
+        Posts go to the active namespace unless another namespace is given."""
+        if namespace is None:
+            namespace = self.active_namespace
         try:
             if not posts:
                 print("No posts to store")
@@ -165,53 +278,10 @@ class BotMemory:
             
             print(f"\nPreparing to store {len(posts)} posts...")
             
-            # Process posts in batches for better efficiency
-            BATCH_SIZE = 50
-            for i in range(0, len(posts), BATCH_SIZE):
-                batch = posts[i:i + BATCH_SIZE]
-                print(f"\nProcessing batch {i//BATCH_SIZE + 1}/{(len(posts) + BATCH_SIZE - 1)//BATCH_SIZE}:")
-                
-                vectors = []
-                for post in batch:
-                    try:
-                        # Generate embedding
-                        embedding = self.openai_client.embeddings.create(
-                            input=post['text'],
-                            model="text-embedding-3-small"
-                        ).data[0].embedding
-                        
-                        vector = {
-                            'id': post['uri'],
-                            'values': embedding,
-                            'metadata': {
-                                'uri': post['uri'],
-                                'cid': post['cid'],
-                                'text': post['text'],
-                                'created_at': post['created_at'],
-                                'position': post['position']
-                            }
-                        }
-                        vectors.append(vector)
-                        
-                    except Exception as e:
-                        print(f"Failed to process post: {str(e)}")
-                        continue
-                
-                # Store batch with retries
-                max_retries = 3
-                for attempt in range(max_retries):
-                    try:
-                        self.index.upsert(vectors=vectors)
-                        time.sleep(1)  # Wait for consistency
-                        
-                        print(f"✓ Successfully stored batch {i//BATCH_SIZE + 1}")
-                        break
-                        
-                    except Exception as e:
-                        print(f"Error on attempt {attempt + 1}: {str(e)}")
-                        if attempt == max_retries - 1:
-                            return False
-                        time.sleep(2)
+            # Embed all posts up front in as few requests as the token limits allow
+            vectors = self._build_vectors(posts, self.embed_texts([post['text'] for post in posts]))
+            if not self._upsert_vectors(vectors, namespace):
+                return False
             
             print("\n✓ All posts successfully stored")
             return True
@@ -220,96 +290,334 @@ class BotMemory:
             print(f"Error in store_thread_posts: {str(e)}")
             return False
 
-    def clear_old_records(self):
-        """Clear all existing records from the index."""
+    @staticmethod
+    def _queue_put(q, item, stop):
+        """Put item on a bounded queue, giving up if the pipeline is stopped."""
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    @staticmethod
+    def _queue_get(q, stop):
+        """Take the next item from a queue, or the end marker if the pipeline is stopped."""
+        while not stop.is_set():
+            try:
+                return q.get(timeout=1)
+            except queue.Empty:
+                pass
+        return _PIPELINE_DONE
+
+    def _fetch_stage(self, client_atproto, bot_handle, pages, stop, stats):
+        """Pipeline stage: feed pages -> pages queue."""
         try:
-            print("\nClearing old records from memory...")
-            # Get list of namespaces
-            describe_index = self.index.describe_index_stats()
-            namespaces = describe_index.namespaces
-
-            if namespaces:
-                # Delete vectors if namespaces exist
-                self.index.delete(delete_all=True, namespace="")
-                print("✓ Successfully cleared old records")
+            for page_posts in self.iter_last_posts(client_atproto, bot_handle):
+                stats['fetched'] += len(page_posts)
+                if not self._queue_put(pages, page_posts, stop):
+                    break
+        except Exception as e:
+            print(f"Error fetching posts for memory: {str(e)}")
+            stats['errors'] += 1
+        finally:
+            self._queue_put(pages, _PIPELINE_DONE, stop)
+
+    def _embed_stage(self, pages, batches, stop, stats):
+        """Pipeline stage: pages queue -> embedded vector batches queue."""
+        try:
+            while True:
+                page_posts = self._queue_get(pages, stop)
+                if page_posts is _PIPELINE_DONE:
+                    break
+                vectors = self._build_vectors(page_posts, self.embed_texts([post['text'] for post in page_posts]))
+                if vectors and not self._queue_put(batches, vectors, stop):
+                    break
+        except Exception as e:
+            print(f"Error embedding posts for memory: {str(e)}")
+            stats['errors'] += 1
+            stop.set()
+        finally:
+            self._queue_put(batches, _PIPELINE_DONE, stop)
+
+    @staticmethod
+    def _collect_upserts(done, in_flight, stats, stop):
+        """Record finished upsert futures; a failed batch stops the pipeline."""
+        for future in done:
+            size = in_flight.pop(future)
+            if future.result():
+                stats['stored'] += size
             else:
-                print("No existing records to clear")
+                stats['errors'] += 1
+                stop.set()
+
+    def stream_posts_to_store(self, client_atproto: Client, bot_handle: str, namespace):
+        """Fetch, embed and upsert the bot's latest posts as a streaming pipeline.
+        Each feed page is embedded while the next one is fetched, and upserted in
+        parallel batches while the following one is embedded; bounded queues
+        between the stages keep at most a few pages in memory. Returns (posts fetched, success)."""
+        pages = queue.Queue(maxsize=MEMORY_PIPELINE_QUEUE_SIZE)
+        batches = queue.Queue(maxsize=MEMORY_PIPELINE_QUEUE_SIZE)
+        stop = threading.Event()
+        stats = {'fetched': 0, 'stored': 0, 'errors': 0}
+        
+        stages = [
+            threading.Thread(target=self._fetch_stage, args=(client_atproto, bot_handle, pages, stop, stats),
+                             name="memory-fetch", daemon=True),
+            threading.Thread(target=self._embed_stage, args=(pages, batches, stop, stats),
+                             name="memory-embed", daemon=True)
+        ]
+        for stage in stages:
+            stage.start()
+        
+        # Upserts run in parallel; at most two rounds of batches are in flight
+        executor = ThreadPoolExecutor(max_workers=MEMORY_UPSERT_CONCURRENCY, thread_name_prefix="memory-upsert")
+        in_flight = {}  # future -> batch size
+        try:
+            while True:
+                vectors = self._queue_get(batches, stop)
+                if vectors is _PIPELINE_DONE:
+                    break
+                for i in range(0, len(vectors), MEMORY_UPSERT_BATCH_SIZE):
+                    if stop.is_set():
+                        break
+                    if len(in_flight) >= MEMORY_UPSERT_CONCURRENCY * 2:
+                        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                        self._collect_upserts(done, in_flight, stats, stop)
+                    batch = vectors[i:i + MEMORY_UPSERT_BATCH_SIZE]
+                    in_flight[executor.submit(self._upsert_batch, batch, namespace)] = len(batch)
+            self._collect_upserts(wait(in_flight).done, in_flight, stats, stop)
+        finally:
+            stop.set()
+            executor.shutdown(wait=True)
+            for stage in stages:
+                stage.join()
+        
+        print(f"\nMemory pipeline: {stats['fetched']} posts fetched, {stats['stored']} vectors stored")
+        return stats['fetched'], stats['errors'] == 0
+
+    @staticmethod
+    def to_timestamp(created_at):
+        """Convert an ISO createdAt string to a unix timestamp for age-based filtering."""
+        try:
+            return datetime.fromisoformat(created_at.replace('Z', '+00:00')).timestamp()
+        except Exception:
+            return time.time()
+
+    def remember_posts(self, posts):
+        """Embed and upsert freshly published posts in the background (write-through indexing).
+        Each post is a dict with uri, cid, text, created_at and position."""
+        if not posts:
+            return None
+        print(f"\n🧠 Adding {len(posts)} new posts to memory")
+        return self.write_executor.submit(self._write_through, posts)
+
+    def _write_through(self, posts):
+        # Capture both namespaces together so a swap can't land between choosing them:
+        # a running rebuild won't see these posts in the feed it already fetched
+        with self.namespace_lock:
+            active_namespace, building_namespace = self.active_namespace, self.building_namespace
+        success = self.store_thread_posts(posts, namespace=active_namespace)
+        if building_namespace:
+            self.store_thread_posts(posts, namespace=building_namespace)
+        return success
+
+    def evict_old_records(self, max_age_days=MEMORY_RETENTION_DAYS):
+        """Delete memories older than max_age_days."""
+        try:
+            cutoff = time.time() - max_age_days * 86400
+            print(f"\nEvicting memories older than {max_age_days} days...")
+            self.store.delete_older_than(cutoff, namespace=self.active_namespace)
+            print("✓ Successfully evicted old records")
             return True
         except Exception as e:
-            print(f"Error clearing old records: {str(e)}")
+            print(f"Error evicting old records: {str(e)}")
             return False
 
+    def load_memory_state(self, filename=MEMORY_STATE_FILE):
+        """Load the last rebuild time and the active/previous namespaces."""
+        try:
+            with open(filename, 'r') as f:
+                state = json.load(f)
+            if state.get('last_rebuild'):
+                self.last_update_time = datetime.fromisoformat(state['last_rebuild'])
+            self.active_namespace = state.get('active_namespace', "")
+            self.previous_namespace = state.get('previous_namespace')
+            print(f"Active memory namespace: '{self.active_namespace}'")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading memory state: {str(e)}")
+
+    def save_memory_state(self, filename=MEMORY_STATE_FILE):
+        """Persist the last rebuild time and the active/previous namespaces."""
+        try:
+            state = {
+                'last_rebuild': self.last_update_time.isoformat() if self.last_update_time else None,
+                'active_namespace': self.active_namespace,
+                'previous_namespace': self.previous_namespace
+            }
+            tmp_filename = f"{filename}.tmp"
+            with open(tmp_filename, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_filename, filename)
+        except Exception as e:
+            print(f"Error saving memory state: {str(e)}")
+
+    def needs_rebuild(self):
+        """Check if a full rebuild is due: the index is empty or the last rebuild is too old."""
+        try:
+            if self.store.count(namespace=self.active_namespace) == 0:
+                return True
+        except Exception as e:
+            print(f"Error reading index stats: {str(e)}")
+        if self.last_update_time is None:
+            return True
+        return datetime.now() - self.last_update_time >= timedelta(days=MEMORY_REBUILD_INTERVAL_DAYS)
+
     def is_memory_updating(self):
         """Check if memory update is in progress."""
         return self.is_updating
 
+    def swap_namespace(self, namespace):
+        """Atomically point readers and writers at a rebuilt namespace, keeping the
+        old one until the next swap and dropping the generation before it."""
+        with self.namespace_lock:
+            stale_namespace = self.previous_namespace
+            self.previous_namespace = self.active_namespace
+            self.active_namespace = namespace
+            # Write-through now targets the new namespace only
+            self.building_namespace = None
+            self.save_memory_state()
+        print(f"✓ Memory now reads from namespace '{namespace}' (previous: '{self.previous_namespace}')")
+        
+        if stale_namespace is not None and stale_namespace not in (self.active_namespace, self.previous_namespace):
+            try:
+                self.store.delete_namespace(stale_namespace)
+                print(f"Deleted old memory namespace '{stale_namespace}'")
+            except Exception as e:
+                print(f"Error deleting old namespace '{stale_namespace}': {str(e)}")
+
+    def _discard_rebuild(self, namespace):
+        """Stop write-through into a failed rebuild's namespace, then delete it."""
+        with self.namespace_lock:
+            if self.building_namespace == namespace:
+                self.building_namespace = None
+        self.store.delete_namespace(namespace)
+
     def update_memory(self, client_atproto: Client, bot_handle: str):
-        """Update memory with latest 1000 posts."""
+        """Rebuild memory from the latest 1000 posts into a fresh namespace and swap
+        readers over once it is verified. Searches keep using the current namespace
+        meanwhile. New posts are indexed as they are published, so this is only a
+        repair job run when needs_rebuild() says so."""
         if self.is_updating:
             return False
         
+        new_namespace = f"gen-{datetime.now().strftime('%Y%m%d%H%M%S')}"
         try:
-            print("\nStarting memory update...")
+            print(f"\nStarting memory update into namespace '{new_namespace}'...")
             self.is_updating = True
-            self.force_stop_needed = False  # Clear force stop flag during update
+            with self.namespace_lock:
+                self.building_namespace = new_namespace
             
-            # Clear old records
-            if not self.clear_old_records():
-                self.is_updating = False
+            # Stream posts from the feed into the new namespace
+            fetched, success = self.stream_posts_to_store(client_atproto, bot_handle, new_namespace)
+            if not fetched:
+                print("\n❌ No posts fetched, keeping current memory")
+                self._discard_rebuild(new_namespace)
                 return False
             
-            # Get and store new posts
-            posts = self.get_last_post(client_atproto, bot_handle)
-            if posts:
-                success = self.store_thread_posts(posts)
-                if success:
-                    print(f"\n✅ Successfully stored {len(posts)} new posts")
-                    self.last_update_time = datetime.now()
-                else:
-                    print("\n❌ Some posts may not have been stored correctly")
+            stored = self.wait_for_count(new_namespace, fetched * MEMORY_REBUILD_MIN_RATIO)
+            if not success or stored < fetched * MEMORY_REBUILD_MIN_RATIO:
+                print(f"\n❌ Rebuild incomplete ({stored}/{fetched} stored), keeping current memory")
+                self._discard_rebuild(new_namespace)
+                return False
             
-            self.is_updating = False
+            print(f"\n✅ Successfully stored {stored} posts")
+            self.last_update_time = datetime.now()
+            self.swap_namespace(new_namespace)
+            self.rebuild_needed = False
             return True
             
         except Exception as e:
             print(f"Error updating memory: {e}")
-            self.is_updating = False
+            try:
+                self._discard_rebuild(new_namespace)
+            except Exception:
+                pass
             raise e
+        finally:
+            self.is_updating = False
+
+    def _format_memories(self, matches):
+        """Turn vector store matches into memory dicts, dropping weak matches."""
+        memories = []
+        for match in matches:
+            if match.score < 0.7:  # Similarity threshold
+                continue
+                
+            memories.append({
+                'text': match.metadata['text'],
+                'created_at': match.metadata['created_at'],
+                'position': match.metadata['position'],
+                'similarity': match.score
+            })
+        return memories
+
+    def search_relevant_memories(self, query_texts, limit=5):
+        """Search memory for several queries at once.
+        Uncached queries are embedded in one request and searched as one batch.
+        Returns a list of memory lists aligned with query_texts."""
+        results = [None] * len(query_texts)
+        version = self.store.version
+        namespace = self.active_namespace
+        
+        # Reuse results for queries already answered since the index last changed
+        pending = []
+        for i, query_text in enumerate(query_texts):
+            cached = self.query_result_cache.get((query_text, limit, namespace, version))
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.append(i)
+        
+        if pending:
+            # Embed the remaining queries, reusing recent query embeddings
+            missing = [query_texts[i] for i in pending if self.query_embedding_cache.get(query_texts[i]) is None]
+            if missing:
+                for text, embedding in zip(missing, self.embed_texts(missing)):
+                    if embedding is not None:
+                        self.query_embedding_cache.set(text, embedding)
+            
+            embedded = [i for i in pending if self.query_embedding_cache.get(query_texts[i]) is not None]
+            for i in pending:
+                if i not in embedded:
+                    print(f"Failed to embed query: {query_texts[i][:100]}...")
+                    results[i] = []
+            
+            # Search the vector store
+            all_matches = self.store.query_batch(
+                [self.query_embedding_cache.get(query_texts[i]) for i in embedded],
+                top_k=limit,
+                namespace=namespace
+            )
+            for i, matches in zip(embedded, all_matches):
+                results[i] = self._format_memories(matches)
+                self.query_result_cache.set((query_texts[i], limit, namespace, version), results[i])
+        
+        return results
 
     def search_relevant_memory(self, query_text, limit=5):
         """Search for relevant past interactions based on the query text."""
         try:
             print(f"\nSearching memory for context relevant to: {query_text[:100]}...")
             
-            # Generate embedding for the query
-            query_embedding = self.openai_client.embeddings.create(
-                input=query_text,
-                model="text-embedding-3-small"
-            ).data[0].embedding
-            
-            # Search Pinecone
-            results = self.index.query(
-                vector=query_embedding,
-                top_k=limit,
-                include_metadata=True
-            )
+            memories = self.search_relevant_memories([query_text], limit=limit)[0]
             
-            if not results.matches:
+            if not memories:
                 print("No relevant memories found")
                 return []
-                
-            # Format results
-            memories = []
-            for match in results.matches:
-                if match.score < 0.7:  # Similarity threshold
-                    continue
-                    
-                memories.append({
-                    'text': match.metadata['text'],
-                    'created_at': match.metadata['created_at'],
-                    'position': match.metadata['position'],
-                    'similarity': match.score
-                })
             
             print(f"\nFound {len(memories)} relevant memories")
             for i, mem in enumerate(memories, 1):
@@ -344,16 +652,3 @@ class BotMemory:
     def should_stop_operations(self):
         """Check if all operations should be stopped for memory update."""
         return self.is_memory_update_time() or self.force_update_needed
-
-    def should_force_stop(self):
-        """Check if immediate stop is needed."""
-        current_time = datetime.now().astimezone(MEMORY_UPDATE_TIMEZONE)
-        is_update_time = (current_time.hour == MEMORY_UPDATE_TIME.hour and 
-                         current_time.minute == MEMORY_UPDATE_TIME.minute)
-        if is_update_time:
-            self.force_stop_needed = True
-        return self.force_stop_needed
-    
-    def clear_force_stop(self):
-        """Clear the force stop flag."""
-        self.force_stop_needed = False
\ No newline at end of file
@@ -0,0 +1,86 @@
+import threading
+import traceback
+from datetime import datetime
+from config import MEMORY_UPDATE_TIMEZONE
+
+
+class Job:
+    """A periodic job running in its own worker thread."""
+
+    def __init__(self, name, func, interval, retry_interval=None, max_retry_interval=None):
+        self.name = name
+        self.func = func
+        self.interval = interval  # Seconds to wait after a successful run
+        self.retry_interval = retry_interval or interval  # Seconds to wait after a failed run
+        # When set, the retry wait doubles after each consecutive failure up to this
+        self.max_retry_interval = max_retry_interval
+        self.failures = 0  # Consecutive failed runs
+        self.last_run = None
+        self.last_success = None
+        self.thread = None
+
+
+class JobRunner:
+    """Runs each periodic job in its own worker thread with its own interval.
+
+    A job function returns a truthy value on success; the runner then waits
+    the job's interval before running it again, otherwise its retry interval
+    (doubling with consecutive failures if the job has a max retry interval).
+    Slow jobs never delay the others."""
+
+    def __init__(self):
+        self.jobs = []
+        self.stop_event = threading.Event()
+
+    def add_job(self, name, func, interval, retry_interval=None, max_retry_interval=None):
+        """Register a periodic job."""
+        job = Job(name, func, interval, retry_interval, max_retry_interval)
+        self.jobs.append(job)
+        return job
+
+    def _run_job(self, job):
+        while not self.stop_event.is_set():
+            ist_time = datetime.now().astimezone(MEMORY_UPDATE_TIMEZONE)
+            print(f"\n[{ist_time}] Running job: {job.name}")
+            job.last_run = datetime.now()
+
+            try:
+                success = job.func()
+            except Exception as e:
+                print(f"Error in job {job.name}: {str(e)}")
+                print(f"Stack trace: {traceback.format_exc()}")
+                success = False
+
+            if success:
+                job.last_success = job.last_run
+                job.failures = 0
+                wait = job.interval
+            else:
+                job.failures += 1
+                wait = job.retry_interval
+                if job.max_retry_interval:
+                    wait = min(job.retry_interval * 2 ** (job.failures - 1), job.max_retry_interval)
+
+            print(f"\n[{job.name}] Waiting {wait} seconds before next run...")
+            self.stop_event.wait(wait)
+
+    def start(self):
+        """Start a worker thread for every registered job."""
+        for job in self.jobs:
+            job.thread = threading.Thread(target=self._run_job, args=(job,), name=job.name, daemon=True)
+            job.thread.start()
+            print(f"Started job '{job.name}' (interval: {job.interval}s)")
+
+    def run_forever(self):
+        """Start all jobs and block until stopped."""
+        self.start()
+        try:
+            while not self.stop_event.wait(1):
+                pass
+        except KeyboardInterrupt:
+            print("\nStopping jobs...")
+            self.stop()
+
+    def stop(self):
+        """Signal all jobs to stop after their current run."""
+        self.stop_event.set()
@@ -0,0 +1,76 @@
+import base64
+import json
+import threading
+import time
+from functions import get_auth_token, refresh_access_token
+from config import TOKEN_REFRESH_MARGIN, TOKEN_DEFAULT_LIFETIME
+
+
+def get_jwt_expiry(token):
+    """Read the `exp` claim (unix time) from a JWT without verifying it."""
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)  # Restore base64 padding
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return float(claims['exp'])
+    except Exception as e:
+        print(f"Could not read token expiry: {str(e)}")
+        return None
+
+
+class SessionManager:
+    """Keeps a valid Bluesky access token for the whole bot.
+
+    Refreshes the session with refreshSession shortly before the access JWT
+    expires and only falls back to createSession (password login) when the
+    refresh fails."""
+
+    def __init__(self, refresh_margin=TOKEN_REFRESH_MARGIN):
+        self.refresh_margin = refresh_margin  # Seconds before expiry to refresh
+        self.access_token = None
+        self.refresh_token = None
+        self.expires_at = None
+        self._lock = threading.RLock()
+
+    def _set_tokens(self, access_token, refresh_token):
+        self.access_token = access_token
+        self.refresh_token = refresh_token
+        self.expires_at = get_jwt_expiry(access_token) or time.time() + TOKEN_DEFAULT_LIFETIME
+        print(f"Access token valid for {int(self.expires_at - time.time())} seconds")
+
+    def _create_session(self):
+        print("Getting new authentication tokens...")
+        access_token, refresh_token = get_auth_token()
+        if not access_token:
+            return False
+        self._set_tokens(access_token, refresh_token)
+        return True
+
+    def _refresh_session(self):
+        if self.refresh_token:
+            print("Refreshing authentication tokens...")
+            access_token, refresh_token = refresh_access_token(self.refresh_token)
+            if access_token:
+                self._set_tokens(access_token, refresh_token)
+                return True
+            print("Token refresh failed, falling back to a new session")
+        return self._create_session()
+
+    def get_access_token(self):
+        """Return a valid access token, refreshing it if it is about to expire."""
+        with self._lock:
+            if self.access_token is None:
+                self._create_session()
+            elif time.time() >= self.expires_at - self.refresh_margin:
+                self._refresh_session()
+            return self.access_token
+
+    def handle_expired(self, failed_token):
+        """Called after a request was rejected as unauthorized.
+        Refreshes the session unless another worker already did, and returns the new token."""
+        with self._lock:
+            if self.access_token and self.access_token != failed_token:
+                return self.access_token
+            if not self._refresh_session():
+                return None
+            return self.access_token
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class StateStore:
+    """Durable bot state in a WAL-mode SQLite database.
+
+    `used_items` holds dedup keys by kind (posts, topics, meme replies) with the
+    time they were added, so membership checks are indexed lookups, appends are
+    single-row inserts and old entries expire by age. `kv` holds small JSON values
+    such as the notification high-water mark."""
+
+    def __init__(self, path='bot_state.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS used_items ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, created_at REAL NOT NULL, "
+            "PRIMARY KEY (kind, key)) WITHOUT ROWID"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_used_items_age ON used_items(kind, created_at)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    def add_items(self, kind, keys, created_at=None):
+        """Add keys of a kind, refreshing the timestamp of keys already present."""
+        now = created_at or time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO used_items (kind, key, created_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (kind, key) DO UPDATE SET created_at = excluded.created_at",
+                [(kind, key, now) for key in keys]
+            )
+            self._conn.commit()
+
+    def has_item(self, kind, key, min_created_at=0):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM used_items WHERE kind = ? AND key = ? AND created_at >= ?",
+                (kind, key, min_created_at)
+            ).fetchone()
+        return row is not None
+
+    def items_since(self, kind, min_created_at=0):
+        """Return (key, created_at) for every item of a kind added since min_created_at."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT key, created_at FROM used_items WHERE kind = ? AND created_at >= ?",
+                (kind, min_created_at)
+            ).fetchall()
+
+    def discard_item(self, kind, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM used_items WHERE kind = ? AND key = ?", (kind, key))
+            self._conn.commit()
+
+    def count_items(self, kind, min_created_at=0):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM used_items WHERE kind = ? AND created_at >= ?",
+                (kind, min_created_at)
+            ).fetchone()[0]
+
+    def expire_items(self, kind, min_created_at):
+        """Delete items of a kind added before min_created_at. Returns the number removed."""
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM used_items WHERE kind = ? AND created_at < ?", (kind, min_created_at)
+            ).rowcount
+            self._conn.commit()
+        return removed
+
+    def get(self, key, default=None):
+        """Read a JSON value from the key-value table."""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value):
+        """Write a JSON value to the key-value table."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, json.dumps(value))
+            )
+            self._conn.commit()
+
+
+class PersistentSet:
+    """A set of strings kept in a StateStore under one kind.
+
+    Entries older than `ttl` seconds no longer count as members and are
+    pruned from the database at most once per `prune_interval`, so dedup
+    history fades out gradually instead of being cleared all at once."""
+
+    def __init__(self, store, kind, ttl, prune_interval=3600):
+        self.store = store
+        self.kind = kind
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self._last_prune = 0
+
+    def _cutoff(self):
+        return time.time() - self.ttl
+
+    def add(self, item):
+        self.store.add_items(self.kind, [item])
+        if time.time() - self._last_prune >= self.prune_interval:
+            self.expire()
+
+    def update(self, items):
+        self.store.add_items(self.kind, list(items))
+
+    def discard(self, item):
+        self.store.discard_item(self.kind, item)
+
+    def recent(self, limit=None):
+        """Return unexpired entries, newest first."""
+        rows = sorted(self.store.items_since(self.kind, self._cutoff()), key=lambda row: row[1], reverse=True)
+        return [key for key, _ in rows[:limit]]
+
+    def expire(self):
+        """Delete entries older than ttl."""
+        self._last_prune = time.time()
+        removed = self.store.expire_items(self.kind, self._cutoff())
+        if removed:
+            print(f"Expired {removed} old '{self.kind}' entries")
+        return removed
+
+    def __contains__(self, item):
+        return self.store.has_item(self.kind, item, self._cutoff())
+
+    def __len__(self):
+        return self.store.count_items(self.kind, self._cutoff())
+
+
+def hash_key(item):
+    """64-bit blake2b hash of a dedup key."""
+    return int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class RotatingDedup:
+    """Time-windowed dedup set of 64-bit hashed keys.
+
+    Keys are hashed to 8 bytes and kept in a ring of `buckets` sets that each
+    cover ttl / buckets seconds. The oldest bucket is dropped as time moves on,
+    so memory stays bounded and entries expire a slice at a time instead of
+    all at once. Hashes are also written to a StateStore so the window
+    survives restarts."""
+
+    def __init__(self, store, kind, ttl, buckets=30):
+        self.store = store
+        self.kind = kind
+        self.ttl = ttl
+        self.buckets = buckets
+        self.bucket_seconds = ttl / buckets
+        self._ring = {}  # bucket number -> set of hashes
+        self._pruned_bucket = None  # Bucket in which stored hashes were last expired
+        self._lock = threading.Lock()
+        self.load()
+
+    def _bucket(self, timestamp):
+        return int(timestamp // self.bucket_seconds)
+
+    def load(self):
+        """Fill the ring from hashes stored within the window."""
+        try:
+            cutoff = time.time() - self.ttl
+            rows = self.store.items_since(self.kind, cutoff)
+            with self._lock:
+                for key, created_at in rows:
+                    self._ring.setdefault(self._bucket(created_at), set()).add(int(key, 16))
+            if rows:
+                print(f"Loaded {len(rows)} '{self.kind}' dedup keys")
+        except Exception as e:
+            print(f"Error loading dedup keys: {str(e)}")
+
+    def _rotate(self, now):
+        """Drop buckets that fell out of the window. Must hold the lock."""
+        oldest = self._bucket(now) - self.buckets + 1
+        for bucket in [bucket for bucket in self._ring if bucket < oldest]:
+            del self._ring[bucket]
+
+    def add(self, item):
+        now = time.time()
+        key = hash_key(item)
+        bucket = self._bucket(now)
+        with self._lock:
+            self._rotate(now)
+            self._ring.setdefault(bucket, set()).add(key)
+            prune = bucket != self._pruned_bucket
+            self._pruned_bucket = bucket
+        self.store.add_items(self.kind, [f"{key:016x}"], created_at=now)
+        if prune:
+            # Stored hashes expire at most once per bucket, like the ring
+            self.store.expire_items(self.kind, now - self.ttl)
+
+    def __contains__(self, item):
+        key = hash_key(item)
+        with self._lock:
+            self._rotate(time.time())
+            return any(key in bucket for bucket in self._ring.values())
+
+    def __len__(self):
+        with self._lock:
+            self._rotate(time.time())
+            return sum(len(bucket) for bucket in self._ring.values())
@@ -0,0 +1,88 @@
+import re
+import threading
+from config import PROMPT_TOKENIZER_MODEL
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character estimate without tiktoken
+    tiktoken = None
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+WORD_PATTERN = re.compile(r"[a-z0-9][a-z0-9'-]+")
+
+
+def _get_encoding(model):
+    with _encodings_lock:
+        if model not in _encodings:
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding('cl100k_base')
+        return _encodings[model]
+
+
+def count_tokens(text, model=PROMPT_TOKENIZER_MODEL):
+    """Count the tokens of text for model (about 4 characters per token without tiktoken)."""
+    if not text:
+        return 0
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    try:
+        return len(_get_encoding(model).encode(text, disallowed_special=()))
+    except Exception:
+        return len(text) // 4 + 1
+
+
+def format_thread_post(post):
+    """Format a get_full_thread_context post the way prompts show it."""
+    return f"[{post['type'].upper()} at depth {post['depth']}]\n@{post['author']}: {post['text']}"
+
+
+def _words(text):
+    return set(WORD_PATTERN.findall(text.lower()))
+
+
+def budget_thread_context(thread_context, query="", budget=2000, format_post=format_thread_post):
+    """Trim get_full_thread_context output to fit a token budget.
+
+    Always keeps the thread's first post and the post the thread was fetched
+    for, then adds its direct ancestors nearest first, then the other posts
+    that share the most words with the target post and query. Kept posts stay
+    in their original order. Returns (posts, tokens_saved)."""
+    if not thread_context:
+        return [], 0
+    
+    tokens = [count_tokens(format_post(post)) + 2 for post in thread_context]  # +2 for the separator
+    total = sum(tokens)
+    if total <= budget:
+        return list(thread_context), 0
+    
+    ancestors = [i for i, post in enumerate(thread_context) if post['type'] == 'parent']
+    targets = [i for i, post in enumerate(thread_context) if post['type'] == 'root']
+    first = min(ancestors or targets or [0], key=lambda i: thread_context[i]['depth'])
+    
+    keep = {first, *targets}
+    used = sum(tokens[i] for i in keep)
+    
+    # Direct ancestors, closest to the target first
+    for i in sorted(ancestors, key=lambda i: thread_context[i]['depth'], reverse=True):
+        if i not in keep and used + tokens[i] <= budget:
+            keep.add(i)
+            used += tokens[i]
+    
+    # Remaining replies by relevance to the conversation being answered
+    query_words = _words(query + " " + " ".join(thread_context[i]['text'] for i in targets))
+    others = [i for i in range(len(thread_context)) if i not in keep and i not in ancestors]
+    others.sort(key=lambda i: (len(_words(thread_context[i]['text']) & query_words), -thread_context[i]['depth']),
+                reverse=True)
+    for i in others:
+        if used + tokens[i] <= budget:
+            keep.add(i)
+            used += tokens[i]
+    
+    tokens_saved = total - used
+    print(f"✂️ Thread context trimmed to {len(keep)}/{len(thread_context)} posts "
+          f"({used} tokens, saved {tokens_saved})")
+    return [post for i, post in enumerate(thread_context) if i in keep], tokens_saved
@@ -0,0 +1,308 @@
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import namedtuple
+import numpy as np
+from config import (VECTOR_STORE_BACKEND,
+                    PINECONE_INDEX_NAME,
+                    LOCAL_VECTOR_STORE_PATH,
+                    EMBEDDING_DIMENSION)
+
+# A single search result
+Match = namedtuple('Match', ['id', 'score', 'metadata'])
+
+
+class VectorStore(ABC):
+    """Interface for the bot's memory vector index.
+
+    Vectors are dicts with 'id', 'values' and 'metadata', as used by Pinecone.
+    Every method works on one namespace so a rebuild can fill a new namespace
+    while readers keep using the current one.
+    `version` is bumped on every change so callers can invalidate cached results."""
+
+    version = 0
+
+    def _changed(self):
+        self.version += 1
+
+    @abstractmethod
+    def upsert(self, vectors, namespace=""):
+        """Insert or replace vectors by id."""
+
+    @abstractmethod
+    def query(self, vector, top_k=5, namespace=""):
+        """Return the top_k most similar vectors as a list of Match, best first."""
+
+    def query_batch(self, vectors, top_k=5, namespace=""):
+        """Run several queries; returns one list of Match per query vector."""
+        return [self.query(vector, top_k=top_k, namespace=namespace) for vector in vectors]
+
+    @abstractmethod
+    def delete_namespace(self, namespace=""):
+        """Remove every vector in a namespace. Returns True if anything was removed."""
+
+    @abstractmethod
+    def delete_older_than(self, cutoff_ts, namespace=""):
+        """Remove vectors whose created_ts metadata is older than cutoff_ts."""
+
+    @abstractmethod
+    def count(self, namespace=""):
+        """Number of stored vectors in a namespace."""
+
+
+class PineconeVectorStore(VectorStore):
+    """Vector store backed by a Pinecone index."""
+
+    def __init__(self, index_name=PINECONE_INDEX_NAME, dimension=EMBEDDING_DIMENSION):
+        # Imported here so the local backend works without the Pinecone client
+        from pinecone import Pinecone
+
+        print("\nConnecting to Pinecone...")
+        pc = Pinecone(api_key=os.getenv('PINECONE_API_KEY'))
+
+        if index_name not in pc.list_indexes().names():
+            print(f"Creating new index: {index_name}")
+            pc.create_index(
+                name=index_name,
+                dimension=dimension,
+                metric='cosine'
+            )
+
+        self.index = pc.Index(index_name)
+        self.dimension = dimension
+
+    def upsert(self, vectors, namespace=""):
+        self.index.upsert(vectors=vectors, namespace=namespace)
+        self._changed()
+
+    def query(self, vector, top_k=5, namespace=""):
+        results = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+            namespace=namespace
+        )
+        return [Match(match.id, match.score, match.metadata) for match in results.matches]
+
+    def delete_namespace(self, namespace=""):
+        # Deleting from a namespace that doesn't exist fails, so check first
+        if namespace in (self.index.describe_index_stats().namespaces or {}):
+            self.index.delete(delete_all=True, namespace=namespace)
+            self._changed()
+            return True
+        return False
+
+    def delete_older_than(self, cutoff_ts, namespace=""):
+        # Serverless indexes don't support deleting by metadata filter, so find the
+        # old ids with a filtered query and delete them by id, 1000 at a time
+        probe = [1.0] + [0.0] * (self.dimension - 1)
+        deleted = set()
+        while True:
+            results = self.index.query(
+                vector=probe,
+                top_k=1000,
+                filter={"created_ts": {"$lt": cutoff_ts}},
+                include_metadata=False,
+                namespace=namespace
+            )
+            ids = [match.id for match in results.matches if match.id not in deleted]
+            if not ids:
+                break
+            self.index.delete(ids=ids, namespace=namespace)
+            deleted.update(ids)
+            self._changed()
+            if len(results.matches) < 1000:
+                break
+
+    def count(self, namespace=""):
+        namespaces = self.index.describe_index_stats().namespaces or {}
+        if namespace not in namespaces:
+            return 0
+        return namespaces[namespace].vector_count
+
+
+class LocalNamespace:
+    """One namespace of the local vector store: a NumPy float32 matrix.
+
+    Vectors are kept L2-normalised so cosine similarity is a single matrix
+    product, and top-k uses argpartition. The matrix is persisted as a
+    memory-mapped .npy file with ids and metadata in a JSON sidecar."""
+
+    def __init__(self, path, dimension=EMBEDDING_DIMENSION):
+        self.vectors_path = f"{path}.npy"
+        self.metadata_path = f"{path}.meta.json"
+        self.dimension = dimension
+        self._lock = threading.RLock()
+        self._vectors = np.zeros((0, dimension), dtype=np.float32)
+        self._ids = []
+        self._metadata = []
+        self._rows = {}  # id -> row
+        self.load()
+
+    def load(self):
+        """Load the matrix (memory-mapped) and its metadata sidecar, if present."""
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.metadata_path)):
+            return
+        try:
+            with open(self.metadata_path, 'r') as f:
+                sidecar = json.load(f)
+            vectors = np.load(self.vectors_path, mmap_mode='r')
+            if vectors.shape[0] != len(sidecar['ids']):
+                print("Local vector store files are out of sync, starting empty")
+                return
+            with self._lock:
+                self._vectors = vectors
+                self._ids = sidecar['ids']
+                self._metadata = sidecar['metadata']
+                self._rows = {vector_id: row for row, vector_id in enumerate(self._ids)}
+            print(f"Loaded {len(self._ids)} vectors from {self.vectors_path}")
+        except Exception as e:
+            print(f"Error loading local vector store: {str(e)}")
+
+    def save(self):
+        """Atomically write the matrix and sidecar, then re-open the matrix memory-mapped."""
+        with self._lock:
+            tmp_vectors = f"{self.vectors_path}.tmp.npy"
+            tmp_metadata = f"{self.metadata_path}.tmp"
+            np.save(tmp_vectors, np.asarray(self._vectors, dtype=np.float32))
+            with open(tmp_metadata, 'w') as f:
+                json.dump({'ids': self._ids, 'metadata': self._metadata}, f)
+            os.replace(tmp_vectors, self.vectors_path)
+            os.replace(tmp_metadata, self.metadata_path)
+            self._vectors = np.load(self.vectors_path, mmap_mode='r')
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+    def upsert(self, vectors):
+        if not vectors:
+            return
+        with self._lock:
+            values = self._normalize(np.asarray([v['values'] for v in vectors], dtype=np.float32))
+            # Copy-on-write: queries keep using the matrix and lists they already snapshotted
+            matrix = np.array(self._vectors, dtype=np.float32)  # Writable copy of the memmap
+            ids = list(self._ids)
+            metadata = list(self._metadata)
+            rows = dict(self._rows)
+            new_rows = []
+            for vector, row_values in zip(vectors, values):
+                row = rows.get(vector['id'])
+                if row is None:
+                    rows[vector['id']] = len(ids)
+                    ids.append(vector['id'])
+                    metadata.append(vector.get('metadata', {}))
+                    new_rows.append(row_values)
+                elif row < len(matrix):
+                    matrix[row] = row_values
+                    metadata[row] = vector.get('metadata', {})
+                else:
+                    # Duplicate id within this upsert
+                    new_rows[row - len(matrix)] = row_values
+                    metadata[row] = vector.get('metadata', {})
+            if new_rows:
+                matrix = np.vstack([matrix, np.asarray(new_rows, dtype=np.float32)])
+            self._vectors, self._ids, self._metadata, self._rows = matrix, ids, metadata, rows
+            self.save()
+
+    def query(self, vector, top_k=5):
+        return self.query_batch([vector], top_k=top_k)[0]
+
+    def query_batch(self, vectors, top_k=5):
+        """Score all queries against the matrix in a single matrix product."""
+        with self._lock:
+            matrix, ids, metadata = self._vectors, self._ids, self._metadata
+        if len(ids) == 0 or len(vectors) == 0:
+            return [[] for _ in vectors]
+        queries = self._normalize(np.asarray(vectors, dtype=np.float32))
+        all_scores = queries @ matrix.T
+        k = min(top_k, len(ids))
+        results = []
+        for scores in all_scores:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            results.append([Match(ids[row], float(scores[row]), metadata[row]) for row in top])
+        return results
+
+    def _keep_rows(self, keep):
+        keep = list(keep)
+        self._vectors = np.array(self._vectors[keep], dtype=np.float32).reshape(-1, self.dimension)
+        self._ids = [self._ids[row] for row in keep]
+        self._metadata = [self._metadata[row] for row in keep]
+        self._rows = {vector_id: row for row, vector_id in enumerate(self._ids)}
+        self.save()
+
+    def delete_older_than(self, cutoff_ts):
+        with self._lock:
+            keep = [row for row, meta in enumerate(self._metadata)
+                    if meta.get('created_ts', cutoff_ts) >= cutoff_ts]
+            if len(keep) != len(self._ids):
+                self._keep_rows(keep)
+
+    def remove_files(self):
+        """Delete the namespace's files from disk."""
+        with self._lock:
+            for path in (self.vectors_path, self.metadata_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def count(self):
+        with self._lock:
+            return len(self._ids)
+
+
+class LocalVectorStore(VectorStore):
+    """In-process vector store; each namespace is a LocalNamespace stored
+    next to `path` (the default namespace uses `path` itself)."""
+
+    def __init__(self, path=LOCAL_VECTOR_STORE_PATH, dimension=EMBEDDING_DIMENSION):
+        self.path = path
+        self.dimension = dimension
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def _namespace(self, namespace):
+        with self._lock:
+            if namespace not in self._namespaces:
+                path = f"{self.path}-{namespace}" if namespace else self.path
+                self._namespaces[namespace] = LocalNamespace(path, self.dimension)
+            return self._namespaces[namespace]
+
+    def upsert(self, vectors, namespace=""):
+        self._namespace(namespace).upsert(vectors)
+        self._changed()
+
+    def query(self, vector, top_k=5, namespace=""):
+        return self._namespace(namespace).query(vector, top_k=top_k)
+
+    def query_batch(self, vectors, top_k=5, namespace=""):
+        return self._namespace(namespace).query_batch(vectors, top_k=top_k)
+
+    def delete_namespace(self, namespace=""):
+        store = self._namespace(namespace)
+        had_vectors = store.count() > 0
+        store.remove_files()
+        with self._lock:
+            self._namespaces.pop(namespace, None)
+        self._changed()
+        return had_vectors
+
+    def delete_older_than(self, cutoff_ts, namespace=""):
+        self._namespace(namespace).delete_older_than(cutoff_ts)
+        self._changed()
+
+    def count(self, namespace=""):
+        return self._namespace(namespace).count()
+
+
+def create_vector_store(backend=VECTOR_STORE_BACKEND):
+    """Create the configured vector store backend ('pinecone' or 'local')."""
+    if backend == 'local':
+        print("\nUsing local vector store...")
+        return LocalVectorStore()
+    if backend == 'pinecone':
+        return PineconeVectorStore()
+    raise ValueError(f"Unknown vector store backend: {backend}")
@@ -0,0 +1,225 @@
+import threading
+import time
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import (XRPC_BASE_URL,
+                    XRPC_POOL_SIZE,
+                    XRPC_CONNECT_TIMEOUT,
+                    XRPC_READ_TIMEOUT,
+                    XRPC_MAX_RETRIES,
+                    XRPC_RATE_LIMIT,
+                    XRPC_RATE_BURST,
+                    XRPC_RATE_MIN,
+                    XRPC_RATE_MAX,
+                    XRPC_RATE_RESERVE)
+
+# Session endpoints with their own (daily) rate limits
+AUTH_METHODS = frozenset(['com.atproto.server.createSession', 'com.atproto.server.refreshSession'])
+
+
+class RateLimiter:
+    """Adaptive token buckets, one per host and rate limit scope.
+
+    Each bucket starts at `rate` requests per second and retunes itself from
+    the RateLimit-Remaining / RateLimit-Reset headers of responses in its own
+    scope: it speeds up (up to `max_rate`) when the server reports headroom
+    and slows down, or pauses until the window resets, before the quota runs
+    out. Scopes keep the small hourly/daily quotas of write and login
+    endpoints from throttling reads."""
+
+    def __init__(self, rate=XRPC_RATE_LIMIT, burst=XRPC_RATE_BURST, min_rate=XRPC_RATE_MIN,
+                 max_rate=XRPC_RATE_MAX, reserve=XRPC_RATE_RESERVE):
+        self.rate = rate  # Initial tokens added per second
+        self.burst = burst  # Bucket capacity
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.reserve = reserve  # Remaining requests kept back before pausing until reset
+        self._buckets = {}  # (host, scope) -> {'tokens', 'last', 'rate', 'blocked_until'}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host, scope, now):
+        bucket = self._buckets.get((host, scope))
+        if bucket is None:
+            bucket = {'tokens': self.burst, 'last': now, 'rate': self.rate, 'blocked_until': 0}
+            self._buckets[(host, scope)] = bucket
+        return bucket
+
+    def acquire(self, host, scope='read'):
+        """Block until a request to host in the given scope is allowed."""
+        while True:
+            with self._lock:
+                now = time.time()
+                bucket = self._bucket(host, scope, now)
+                if bucket['blocked_until'] > now:
+                    wait = bucket['blocked_until'] - now
+                else:
+                    bucket['tokens'] = min(self.burst, bucket['tokens'] + (now - bucket['last']) * bucket['rate'])
+                    bucket['last'] = now
+                    if bucket['tokens'] >= 1:
+                        bucket['tokens'] -= 1
+                        return
+                    wait = (1 - bucket['tokens']) / bucket['rate']
+            time.sleep(wait)
+
+    def update(self, host, response, scope='read'):
+        """Retune the host's rate for a scope from a response's rate limit headers."""
+        headers = response.headers
+        now = time.time()
+        try:
+            remaining = headers.get('RateLimit-Remaining')
+            reset = headers.get('RateLimit-Reset')
+            reset = float(reset) if reset is not None else None
+            if reset is not None and reset < 1e9:
+                reset = now + reset  # Delta-seconds form instead of a unix timestamp
+        except ValueError:
+            return
+
+        with self._lock:
+            bucket = self._bucket(host, scope, now)
+
+            if response.status_code == 429:
+                retry_after = headers.get('Retry-After')
+                if reset is None and retry_after and retry_after.isdigit():
+                    reset = now + int(retry_after)
+                bucket['blocked_until'] = reset or now + 60
+                bucket['tokens'] = 0
+                print(f"Rate limited by {host} ({scope}), pausing for {bucket['blocked_until'] - now:.0f}s")
+                return
+
+            if remaining is None or reset is None:
+                return
+            try:
+                remaining = int(remaining)
+            except ValueError:
+                return
+
+            window = max(reset - now, 1)
+            if remaining <= self.reserve:
+                # Nearly out of quota: wait for the window to reset instead of hitting a 429
+                bucket['blocked_until'] = reset
+                bucket['tokens'] = 0
+                print(f"Rate limit nearly exhausted for {host} ({scope}), pausing for {window:.0f}s")
+            else:
+                # Spread the remaining quota evenly over the rest of the window
+                allowed = (remaining - self.reserve) / window
+                bucket['rate'] = max(self.min_rate, min(self.max_rate, allowed))
+
+
+class XRPCClient:
+    """Shared keep-alive client for Bluesky XRPC calls.
+
+    Holds a single pooled session so every call reuses open TLS connections,
+    applies default connect/read timeouts and injects the Authorization header."""
+
+    def __init__(self, base_url=XRPC_BASE_URL, pool_size=XRPC_POOL_SIZE,
+                 timeout=(XRPC_CONNECT_TIMEOUT, XRPC_READ_TIMEOUT), max_retries=XRPC_MAX_RETRIES,
+                 rate_limiter=None):
+        self.base_url = base_url.rstrip('/')
+        self.host = urlparse(self.base_url).netloc
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.token = None  # Default access token used when a call doesn't pass one
+        self.session_manager = None  # Optional SessionManager providing and refreshing the token
+        self.session = requests.Session()
+
+        # Retry idempotent requests on connection errors and gateway failures.
+        # POSTs (createRecord etc.) are not retried here; callers keep their own retry logic.
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+        # Block for a free connection instead of opening one that is thrown away afterwards
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=retry, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def url(self, method):
+        """Build the full URL for an XRPC method name."""
+        return f"{self.base_url}/xrpc/{method}"
+
+    def current_token(self):
+        """Default access token for calls that don't pass one."""
+        if self.session_manager:
+            return self.session_manager.get_access_token()
+        return self.token
+
+    def _headers(self, token, headers):
+        merged = dict(headers or {})
+        if token and 'Authorization' not in merged:
+            merged['Authorization'] = f"Bearer {token}"
+        return merged
+
+    @staticmethod
+    def is_auth_error(response):
+        """Check whether a response rejected an expired or invalid access token."""
+        if response.status_code == 401:
+            return True
+        if response.status_code == 400:
+            try:
+                return response.json().get('error') in ('ExpiredToken', 'InvalidToken')
+            except ValueError:
+                return False
+        return False
+
+    @staticmethod
+    def rate_scope(http_method, method):
+        """Rate limit scope of an XRPC call: login and repo writes have their own quotas."""
+        if method in AUTH_METHODS:
+            return 'auth'
+        if http_method != 'GET' and method.startswith('com.atproto.repo.'):
+            return 'write'
+        return 'read'
+
+    def _send(self, http_method, method, token, headers, timeout, **kwargs):
+        # On a 429 the limiter pauses until the window resets, then the request is tried once more
+        scope = self.rate_scope(http_method, method)
+        for attempt in range(2):
+            self.rate_limiter.acquire(self.host, scope)
+            response = self.session.request(
+                http_method,
+                self.url(method),
+                headers=self._headers(token, headers),
+                timeout=timeout or self.timeout,
+                **kwargs
+            )
+            self.rate_limiter.update(self.host, response, scope)
+            if response.status_code != 429:
+                break
+        return response
+
+    def request(self, http_method, method, token=None, headers=None, timeout=None, auth=True, **kwargs):
+        """Send a request to an XRPC method and return the raw response.
+
+        With auth=True the access token is injected (the given token, else the
+        session's) and an expired-token response is retried once with a
+        refreshed token. auth=False sends only an explicitly given token."""
+        if auth:
+            token = token or self.current_token()
+        response = self._send(http_method, method, token, headers, timeout, **kwargs)
+
+        if auth and self.session_manager and self.is_auth_error(response):
+            print(f"Access token rejected for {method}, refreshing session and retrying...")
+            new_token = self.session_manager.handle_expired(token)
+            if new_token:
+                response = self._send(http_method, method, new_token, headers, timeout, **kwargs)
+        return response
+
+    def get(self, method, params=None, token=None, **kwargs):
+        """Call an XRPC query (GET)."""
+        return self.request('GET', method, token=token, params=params, **kwargs)
+
+    def post(self, method, json=None, data=None, token=None, **kwargs):
+        """Call an XRPC procedure (POST)."""
+        return self.request('POST', method, token=token, json=json, data=data, **kwargs)
+
+
+# Shared client used by every Bluesky call
+xrpc = XRPCClient()